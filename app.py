@@ -1,40 +1,245 @@
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, Response, g, render_template, request, jsonify, stream_with_context
+import io
+import json
+import os
+import threading
+import time
 import traceback
 
+from cache import LRUCache, ParaphraseCache, SqliteCache, default_cache_path, make_key
+from engines import EngineRegistry
+import metrics
+from scheduler import DeadlineExceeded, Overloaded, Scheduler
+from sessions import DocumentTooLong, VersionConflict
+
 app = Flask(__name__)
 
 # Configuration
 PARAPHRASER_TYPE = "enhanced"  # "simple", "enhanced", or "ml"
 
+# Worker processes for /paraphrase/batch (None means one per CPU core)
+BATCH_WORKERS = None
+# Start the batch worker processes at warm-up instead of on the first batch.
+# Every process serving the app (e.g. each gunicorn worker) starts its own
+# pool, so this is off by default.
+WARM_BATCH_POOL = False
+
+# Result cache: an in-process LRU in front of a sqlite file shared by every
+# worker process on the host (set SHARED_CACHE_PATH to None to disable it)
+CACHE_SIZE = 10000
+CACHE_TTL = 3600  # seconds
+SHARED_CACHE_PATH = default_cache_path()
+
+# Admission control: each lane has its own worker threads, a bounded queue
+# (a full lane answers 429) and a per-request deadline in seconds (503 when
+# missed).  Streams get stream_timeout seconds per segment instead.  The
+# rule-based engines use the fast lane, so they never wait behind ML jobs.
+LANES = {
+    'fast': dict(concurrency=8, queue_size=64, timeout=10, stream_timeout=10),
+    # Enough concurrent ML requests to fill a micro-batch of the inference worker
+    'ml': dict(concurrency=16, queue_size=32, timeout=60, stream_timeout=60),
+}
+
+# Candidate paraphrases the rule-based engines generate and score for each
+# text of /paraphrase and /paraphrase/batch, returning the best, unless the
+# request asks for another number ("candidates").  Each candidate costs about
+# as much as a paraphrase, so scoring is off (1) by default.  The ML engine
+# scores the beams of its own search instead.
+CANDIDATES = 1
+
+# Request size limits
+MAX_TEXT_LENGTH = 100000  # characters per text for /paraphrase and /paraphrase/batch
+MAX_BATCH_SIZE = 10000  # texts per /paraphrase/batch request
+MAX_VARIANTS = 20  # paraphrases per /paraphrase request
+MAX_CANDIDATES = 20  # candidates scored per text
+MAX_DOCUMENT_ID_LENGTH = 200  # characters per /paraphrase/session document id
+app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # bytes per request body
+
+# Engine label used in metrics for each paraphraser module
+ENGINE_NAMES = {
+    'paraphraser_example': 'ml',
+    'enhanced_paraphraser': 'enhanced',
+    'simple_paraphraser': 'simple',
+}
+
+# Editing sessions for /paraphrase/session, kept in each worker process and
+# dropped after SESSION_TTL seconds without an update
+SESSION_LIMIT = 1000
+SESSION_TTL = 3600  # seconds
+
+_result_cache = None
+_scheduler = None
+_engines = None
+_sessions = None
+# Guards the lazy creation of the objects above, since requests arrive on several threads
+_init_lock = threading.Lock()
+
+def get_result_cache():
+    """
+    Returns the result cache, creating it on first use.
+    """
+    global _result_cache
+    if _result_cache is None:
+        with _init_lock:
+            if _result_cache is None:
+                shared = SqliteCache(SHARED_CACHE_PATH, ttl=CACHE_TTL) if SHARED_CACHE_PATH else None
+                _result_cache = ParaphraseCache(LRUCache(CACHE_SIZE, CACHE_TTL), shared)
+    return _result_cache
+
+def get_scheduler():
+    """
+    Returns the request scheduler, creating its lanes on first use.
+    """
+    global _scheduler
+    if _scheduler is None:
+        with _init_lock:
+            if _scheduler is None:
+                _scheduler = Scheduler(LANES)
+    return _scheduler
+
+def get_sessions():
+    """
+    Returns the store of editing sessions by document id, creating it on first use.
+    """
+    global _sessions
+    if _sessions is None:
+        with _init_lock:
+            if _sessions is None:
+                _sessions = LRUCache(SESSION_LIMIT, SESSION_TTL)
+    return _sessions
+
+def get_engines():
+    """
+    Returns the engine registry, creating it on first use.
+    """
+    global _engines
+    if _engines is None:
+        with _init_lock:
+            if _engines is None:
+                _engines = EngineRegistry()
+    return _engines
+
+def get_lane(paraphraser):
+    """
+    Returns the scheduler lane that requests for a paraphraser module run in.
+    """
+    return 'ml' if paraphraser.__name__ == 'paraphraser_example' else 'fast'
+
+def run_in_lane(paraphraser, function_name, *args):
+    """
+    Runs one of the paraphraser module's functions in its lane, under the lane's deadline.
+    """
+    lane = get_lane(paraphraser)
+    function = getattr(paraphraser, function_name)
+    if lane == 'ml':
+        # Let the inference worker drop the request if it is still queued at the deadline
+        return get_scheduler().call(lane, function, *args, timeout=LANES[lane]['timeout'])
+    return get_scheduler().call(lane, function, *args)
+
+def get_candidate_count(data):
+    """
+    Returns the candidate paraphrases to score per text (candidates, default CANDIDATES), raising ValueError if invalid.
+    """
+    candidates = data.get('candidates', CANDIDATES) if isinstance(data, dict) else CANDIDATES
+    if isinstance(candidates, bool) or not isinstance(candidates, int) or not 1 <= candidates <= MAX_CANDIDATES:
+        raise ValueError(f'candidates must be an integer from 1 to {MAX_CANDIDATES}')
+    return candidates
+
+def get_seed(data):
+    """
+    Returns the optional integer seed from a request body, raising ValueError if it is invalid.
+    """
+    seed = data.get('seed') if isinstance(data, dict) else None
+    if seed is not None and (isinstance(seed, bool) or not isinstance(seed, int)):
+        raise ValueError('seed must be an integer')
+    return seed
+
+def get_variant_count(data):
+    """
+    Returns the number of paraphrases requested (n, default 1), raising ValueError if it is invalid.
+    """
+    n = data.get('n', 1)
+    if isinstance(n, bool) or not isinstance(n, int) or not 1 <= n <= MAX_VARIANTS:
+        raise ValueError(f'n must be an integer from 1 to {MAX_VARIANTS}')
+    return n
+
+def get_paraphraser_module():
+    """
+    Returns the paraphraser module selected by the configuration.
+
+    The module is imported once, on first use.  If the ML engine is selected
+    but its dependencies aren't installed, the enhanced engine is used instead.
+    """
+    return get_engines().get(PARAPHRASER_TYPE)
+
+def start_warm_up():
+    """
+    Starts loading the configured engine on a background thread, so the first request doesn't wait for it.
+    """
+    return get_engines().warm_up(PARAPHRASER_TYPE, workers=BATCH_WORKERS, start_pool=WARM_BATCH_POOL)
+
 def get_paraphraser():
     """
     Returns the appropriate paraphraser function based on configuration.
     """
-    if PARAPHRASER_TYPE == "ml":
-        try:
-            # Try to import the ML-based paraphraser
-            from paraphraser_example import paraphrase_text
-            print("Using ML-based paraphraser")
-            return paraphrase_text
-        except ImportError as e:
-            print(f"Warning: ML dependencies not found: {str(e)}. Falling back to enhanced paraphraser.")
-            from enhanced_paraphraser import paraphrase_text
-            return paraphrase_text
-    elif PARAPHRASER_TYPE == "enhanced":
-        # Use the enhanced rule-based paraphraser
-        print("Using enhanced rule-based paraphraser")
-        from enhanced_paraphraser import paraphrase_text
-        return paraphrase_text
-    else:
-        # Use the simple rule-based paraphraser
-        print("Using simple rule-based paraphraser")
-        from simple_paraphraser import paraphrase_text
-        return paraphrase_text
+    return get_paraphraser_module().paraphrase_text
+
+def record_request(paraphraser, characters):
+    """
+    Records the engine serving this request and the size of its input.
+    """
+    g.engine = ENGINE_NAMES.get(paraphraser.__name__, paraphraser.__name__)
+    metrics.REQUEST_CHARS.observe(characters, request.url_rule.rule)
+    app.logger.debug(f"Paraphrasing {characters} characters with the {g.engine} engine")
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+
+@app.after_request
+def record_request_metrics(response):
+    # Streamed responses are timed to the first byte
+    endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+    metrics.REQUEST_SECONDS.observe(time.perf_counter() - g.request_start, endpoint)
+    metrics.REQUESTS.inc(endpoint, g.get('engine', 'none'), str(response.status_code))
+    return response
+
+@app.errorhandler(Overloaded)
+def handle_overloaded(e):
+    metrics.REJECTED.inc(e.lane, 'overloaded')
+    response = jsonify({'error': str(e)})
+    response.headers['Retry-After'] = str(e.retry_after)
+    return response, 429
+
+@app.errorhandler(DeadlineExceeded)
+def handle_deadline_exceeded(e):
+    metrics.REJECTED.inc(e.lane, 'deadline')
+    return jsonify({'error': str(e)}), 503
 
 @app.route('/')
 def index():
     return render_template('index.html')
 
+@app.route('/ready')
+def ready():
+    """
+    Reports whether the configured engine has finished warming up (200) or not (503), and the state of each engine.
+    """
+    engines = get_engines()
+    is_ready = engines.is_ready(PARAPHRASER_TYPE)
+    return jsonify({
+        'ready': is_ready,
+        'engine': PARAPHRASER_TYPE,
+        'engines': engines.status()
+    }), 200 if is_ready else 503
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """
+    Exports request, cache and per-stage timing metrics in the Prometheus text format.
+    """
+    return Response(metrics.REGISTRY.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
 @app.route('/paraphrase', methods=['POST'])
 def paraphrase():
     data = request.get_json()
@@ -42,31 +247,242 @@ def paraphrase():
     
     if not original_text:
         return jsonify({'error': 'No text provided'}), 400
+    if len(original_text) > MAX_TEXT_LENGTH:
+        return jsonify({'error': f'Text is longer than {MAX_TEXT_LENGTH} characters'}), 413
+    try:
+        seed = get_seed(data)
+        n = get_variant_count(data)
+        candidates = get_candidate_count(data)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     
     try:
         # Get the appropriate paraphraser
-        paraphrase_text = get_paraphraser()
+        paraphraser = get_paraphraser_module()
+        record_request(paraphraser, len(original_text))
+        if n > 1 and not hasattr(paraphraser, 'paraphrase_variants'):
+            return jsonify({'error': 'This paraphraser produces one paraphrase per text'}), 400
+        ranked = candidates > 1 and hasattr(paraphraser, 'paraphrase_ranked')
         
-        # Print debug info
-        print(f"Received text for paraphrasing: {original_text[:50]}...")
+        # Reuse a cached result when the paraphraser's output is reproducible
+        namespace = paraphraser.cache_namespace(seed)
+        if namespace and ranked:
+            namespace = f"{namespace}:best={candidates}"
+        if namespace and n > 1:
+            namespace = f"{namespace}:n={n}"
+        cache_key = make_key(namespace, seed, original_text) if namespace else None
+        cached = get_result_cache().get(cache_key) if cache_key else None
+        if cache_key:
+            metrics.CACHE_LOOKUPS.inc(g.engine, 'miss' if cached is None else 'hit')
         
-        # Get paraphrased text
-        paraphrased_text = paraphrase_text(original_text)
+        if n > 1:
+            # Several distinct paraphrases, cached together as a JSON list
+            if cached is not None:
+                variants = json.loads(cached)
+            elif ranked:
+                variants = run_in_lane(paraphraser, 'paraphrase_ranked', original_text, n, candidates, seed)
+            else:
+                variants = run_in_lane(paraphraser, 'paraphrase_variants', original_text, n, seed)
+            if cached is None and cache_key:
+                get_result_cache().set(cache_key, json.dumps(variants))
+            return jsonify({
+                'original': original_text,
+                'paraphrased': variants[0],
+                'variants': variants
+            })
         
-        print(f"Paraphrased result: {paraphrased_text[:50]}...")
+        paraphrased_text = cached
+        if paraphrased_text is None:
+            # Get paraphrased text, the best scoring of several candidates if asked for and the engine can
+            if ranked:
+                paraphrased_text = run_in_lane(paraphraser, 'paraphrase_ranked', original_text, 1, candidates, seed)[0]
+            else:
+                paraphrased_text = run_in_lane(paraphraser, 'paraphrase_text', original_text, seed)
+            if cache_key:
+                get_result_cache().set(cache_key, paraphrased_text)
         
         return jsonify({
             'original': original_text, 
             'paraphrased': paraphrased_text
         })
+    except (Overloaded, DeadlineExceeded):
+        raise
+    except Exception as e:
+        error_info = traceback.format_exc()
+        app.logger.error(f"Error during paraphrasing: {str(e)}\n{error_info}")
+        return jsonify({
+            'error': str(e),
+            'details': error_info
+        }), 500
+
+@app.route('/paraphrase/batch', methods=['POST'])
+def paraphrase_batch():
+    data = request.get_json(silent=True)
+    # Accept either a bare JSON array or {"texts": [...]}
+    texts = data.get('texts') if isinstance(data, dict) else data
+    
+    if not isinstance(texts, list) or not all(isinstance(text, str) for text in texts):
+        return jsonify({'error': 'Expected a JSON array of strings'}), 400
+    if len(texts) > MAX_BATCH_SIZE or any(len(text) > MAX_TEXT_LENGTH for text in texts):
+        return jsonify({'error': f'At most {MAX_BATCH_SIZE} texts of up to {MAX_TEXT_LENGTH} characters each'}), 413
+    try:
+        seed = get_seed(data)
+        candidates = get_candidate_count(data)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    try:
+        paraphraser = get_paraphraser_module()
+        record_request(paraphraser, sum(len(text) for text in texts))
+        if candidates > 1 and hasattr(paraphraser, 'paraphrase_ranked'):
+            paraphrased_texts = run_in_lane(paraphraser, 'paraphrase_batch', texts, BATCH_WORKERS, seed, candidates)
+        else:
+            paraphrased_texts = run_in_lane(paraphraser, 'paraphrase_batch', texts, BATCH_WORKERS, seed)
+        
+        return jsonify({'paraphrased': paraphrased_texts})
+    except (Overloaded, DeadlineExceeded):
+        raise
+    except Exception as e:
+        error_info = traceback.format_exc()
+        app.logger.error(f"Error during batch paraphrasing: {str(e)}\n{error_info}")
+        return jsonify({
+            'error': str(e),
+            'details': error_info
+        }), 500
+
+@app.route('/paraphrase/session', methods=['POST'])
+def paraphrase_session():
+    """
+    Paraphrases a document that is being edited, redoing only the sentences that changed.
+
+    The body names the document ({"document": id}) and gives either its whole
+    text ({"text": ...}, which starts the session, with an optional seed) or
+    edits to the version last returned ({"version": v, "edits": [{"start",
+    "end", "text"}, ...]}, offsets in characters).  The response describes the
+    change to the paraphrased segments: replace segments[start:end] with
+    segments, giving version.  The change for a whole text is against the
+    version given with it, or lists every segment if there is none.  Edits to
+    a document this process doesn't know, or to another version, get 409 and
+    should be followed by the whole text.
+    """
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({'error': 'Expected a JSON object'}), 400
+    document = data.get('document')
+    if not isinstance(document, str) or not document or len(document) > MAX_DOCUMENT_ID_LENGTH:
+        return jsonify({'error': f'document must be a string of 1 to {MAX_DOCUMENT_ID_LENGTH} characters'}), 400
+    text = data.get('text')
+    edits = data.get('edits')
+    if text is None and edits is None:
+        return jsonify({'error': 'Provide either text or edits'}), 400
+    if text is not None and not isinstance(text, str) or edits is not None and not isinstance(edits, list):
+        return jsonify({'error': 'text must be a string and edits a list'}), 400
+    if text is None and not isinstance(data.get('version'), int):
+        return jsonify({'error': 'Edits need the version they apply to'}), 400
+    try:
+        seed = get_seed(data)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    try:
+        paraphraser = get_paraphraser_module()
+        if not hasattr(paraphraser, 'create_session'):
+            return jsonify({'error': 'This paraphraser does not support editing sessions'}), 400
+        lane = get_lane(paraphraser)
+        session = get_sessions().get(document)
+        
+        if text is not None:
+            record_request(paraphraser, len(text))
+            # A new seed starts the document over
+            if session is None or (seed is not None and seed != session.seed):
+                session = paraphraser.create_session(seed, MAX_TEXT_LENGTH)
+            change = get_scheduler().call(lane, session.set_text, text, data.get('version'))
+        else:
+            record_request(paraphraser, sum(len(edit.get('text', '')) for edit in edits if isinstance(edit, dict)))
+            if session is None:
+                return jsonify({'error': 'Unknown document, send its whole text'}), 409
+            change = get_scheduler().call(lane, session.apply_edits, edits, data.get('version'))
+        # Storing the session again keeps it alive for another SESSION_TTL
+        get_sessions().set(document, session)
+        
+        return jsonify(dict(change, document=document))
+    except VersionConflict as e:
+        return jsonify({'error': f'{str(e)}, send the whole text'}), 409
+    except DocumentTooLong as e:
+        return jsonify({'error': str(e)}), 413
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except (Overloaded, DeadlineExceeded):
+        raise
     except Exception as e:
         error_info = traceback.format_exc()
-        print(f"Error during paraphrasing: {str(e)}")
-        print(error_info)
+        app.logger.error(f"Error during session paraphrasing: {str(e)}\n{error_info}")
         return jsonify({
             'error': str(e),
             'details': error_info
         }), 500
 
+@app.route('/paraphrase/stream', methods=['POST'])
+def paraphrase_stream():
+    """
+    Streams the paraphrase back one segment at a time as newline-delimited JSON.
+
+    The body is either JSON ({"text": ..., "seed": ...}) or plain text, which is
+    read from the request stream as it is paraphrased.  Each line of the
+    response is {"segment": ...}, and the last is {"done": true} (or {"error": ...}).
+    """
+    if request.is_json:
+        data = request.get_json()
+        source = data.get('text', '')
+        if not source:
+            return jsonify({'error': 'No text provided'}), 400
+    else:
+        data = None
+        source = io.TextIOWrapper(request.stream, encoding=request.mimetype_params.get('charset', 'utf-8'))
+    try:
+        seed = get_seed(data)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    paraphraser = get_paraphraser_module()
+    # A plain-text body is read as it streams, so its size is only known when declared
+    record_request(paraphraser, len(source) if isinstance(source, str) else request.content_length or 0)
+    # The stream is produced on this request's thread, so it holds a lane slot
+    # (answering 429 if there is none).  Each segment must follow the one before
+    # within the lane's stream_timeout, however long the whole stream takes.
+    admission = get_scheduler().admit(get_lane(paraphraser))
+    
+    def generate():
+        try:
+            if hasattr(paraphraser, 'iter_paraphrase'):
+                segments = paraphraser.iter_paraphrase(source, seed)
+            else:
+                # Engines without a streaming mode return everything at once
+                text = source if isinstance(source, str) else source.read()
+                segments = [paraphraser.paraphrase_text(text, seed)]
+            for segment in segments:
+                admission.check()
+                yield json.dumps({'segment': segment}) + '\n'
+            yield json.dumps({'done': True}) + '\n'
+        except Exception as e:
+            app.logger.error(f"Error during streaming paraphrasing: {str(e)}\n{traceback.format_exc()}")
+            yield json.dumps({'error': str(e)}) + '\n'
+        finally:
+            admission.release()
+    
+    response = Response(
+        stream_with_context(generate()),
+        mimetype='application/x-ndjson',
+        # Ask reverse proxies not to buffer the stream
+        headers={'X-Accel-Buffering': 'no'}
+    )
+    # Give the slot back even if the client goes away before the stream starts
+    response.call_on_close(admission.release)
+    return response
+
+# Warm up at startup, except in the debug reloader's watcher process, which never serves requests
+if __name__ != '__main__' or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+    start_warm_up()
+
 if __name__ == '__main__':
     app.run(debug=True)
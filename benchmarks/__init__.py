@@ -0,0 +1,25 @@
+"""Performance benchmarks for the paraphrasing engines and the HTTP service.
+
+Run everything and write the results to JSON:
+
+    python -m benchmarks run --output results.json
+
+Compare a run against a stored baseline (exits with status 1 on regressions):
+
+    python -m benchmarks compare baseline.json results.json
+
+Fuzz the sentence transformations against the regular expressions they
+replace and time them on pathological segments:
+
+    python -m benchmarks transformations
+
+Check incremental editing sessions against whole-text ones and time
+keystrokes on documents of growing size:
+
+    python -m benchmarks sessions
+
+Compare the latency and outputs of the ML engine's inference profiles on a
+tiny local T5 checkpoint (needs torch and transformers):
+
+    python -m benchmarks ml
+"""
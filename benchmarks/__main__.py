@@ -0,0 +1,284 @@
+import argparse
+import datetime
+import json
+import os
+import platform
+import sys
+
+from benchmarks.corpus import SIZES, make_corpus, make_text
+from benchmarks.domains import VOCABULARY_TOLERANCE, run_domains
+from benchmarks.load import run_load
+from benchmarks.matcher import fuzz as fuzz_matcher, run_matcher
+from benchmarks.micro import run_micro
+from benchmarks.ml import (BATCHING_SENTENCES, MEMO_BATCH_SIZE, MEMO_DOCUMENTS, REFERENCE_PROFILE,
+                           default_checkpoint_path, make_tiny_checkpoint, run_batching, run_memo, run_ml)
+from benchmarks.sessions import SIZE_TOLERANCE, fuzz as fuzz_sessions, run_sessions
+from benchmarks.stats import compare
+from benchmarks.transformations import compare_with_regex, fuzz, run_transformations
+from paraphraser_example import PROFILES
+
+
+def print_results(results):
+    print(f"{'benchmark':<40} {'calls/s':>10} {'p50 ms':>10} {'p95 ms':>10} {'p99 ms':>10}")
+    for name, result in results.items():
+        print(f"{name:<40} {result['throughput']:>10.1f} {result['p50_ms']:>10.3f} "
+              f"{result['p95_ms']:>10.3f} {result['p99_ms']:>10.3f}")
+
+
+def run(args):
+    corpus = make_corpus(args.sizes)
+    results = run_micro(corpus, args.min_time)
+
+    if not args.skip_load:
+        texts = [make_text(SIZES['paragraph'], seed) for seed in range(16)]
+        for concurrency in args.concurrency:
+            results[f'http/paraphrase[c={concurrency}]'] = run_load(
+                texts, concurrency, args.requests, args.url)
+
+    report = {
+        'meta': {
+            'timestamp': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'sizes': args.sizes or list(SIZES),
+        },
+        'results': results,
+    }
+    print_results(results)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Wrote {args.output}")
+    return 0
+
+
+def run_compare(args):
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.current) as f:
+        current = json.load(f)
+
+    regressions = compare(baseline, current, args.threshold)
+    for name, metric, before, after in regressions:
+        print(f"REGRESSION {name} {metric}: {before:.3f} -> {after:.3f} ({(after - before) / before:+.1%})")
+    if not regressions:
+        print(f"No regressions beyond {args.threshold:.0%}")
+    return 1 if regressions else 0
+
+
+def run_transformation_checks(args):
+    mismatches = fuzz(args.iterations, args.seed)
+    for name, text, expected, actual in mismatches[:10]:
+        print(f"MISMATCH {name} on {text!r}: expected {expected!r}, got {actual!r}")
+    print(f"Fuzzed {args.iterations} segments: {len(mismatches)} mismatches with re.sub")
+
+    print(f"{'transformation':<40} {'re.sub ms':>10} {'engine ms':>10}")
+    for (name, input_name), (regex, engine) in compare_with_regex().items():
+        print(f"{f'{name}[{input_name},1024]':<40} {regex * 1000:>10.3f} {engine * 1000:>10.3f}")
+
+    results, nonlinear = run_transformations(args.min_time)
+    print_results(results)
+    for name, input_name, slowdown in nonlinear:
+        print(f"NONLINEAR {name}[{input_name}]: time per character grew {slowdown:.1f}x")
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'results': results}, f, indent=2)
+        print(f"Wrote {args.output}")
+    return 1 if mismatches or nonlinear else 0
+
+
+def run_matcher_checks(args):
+    mismatches = fuzz_matcher(args.iterations, args.seed)
+    for text, expected, actual, problem in mismatches[:10]:
+        print(f"MISMATCH on {text!r}: expected {expected!r}, got {actual!r}" + (f" ({problem})" if problem else ""))
+    print(f"Fuzzed {args.iterations} segments: {len(mismatches)} mismatches with the reference matcher")
+
+    results = run_matcher(args.repeats)
+    print(f"{'segments':<12} {'count':>8} {'split us':>10} {'finditer us':>12} {'replace us':>12}")
+    for name, result in results.items():
+        print(f"{name:<12} {result['segments']:>8} {result['baseline_us']:>10.2f} "
+              f"{result['finditer_us']:>12.2f} {result['replace_us']:>12.2f}")
+    print("split: the split/strip loop the paraphraser used before LexiconMatcher, which misses phrases")
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'results': results}, f, indent=2)
+        print(f"Wrote {args.output}")
+    return 1 if mismatches else 0
+
+
+def run_session_checks(args):
+    mismatches = fuzz_sessions(args.documents, args.edits, args.seed)
+    for text, edits in mismatches[:10]:
+        print(f"MISMATCH after {edits!r}: {text[:200]!r}")
+    print(f"Edited {args.documents} documents {args.edits} times: {len(mismatches)} mismatches with whole-text sessions")
+
+    results, growth = run_sessions(args.min_time)
+    print_results(results)
+    nonlinear = growth > SIZE_TOLERANCE
+    if nonlinear:
+        print(f"KEYSTROKE TIME GREW {growth:.1f}x with document size")
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'results': results}, f, indent=2)
+        print(f"Wrote {args.output}")
+    return 1 if mismatches or nonlinear else 0
+
+
+def run_domain_checks(args):
+    results, growth = run_domains(args.min_time)
+    print_results(results)
+    slower = growth > VOCABULARY_TOLERANCE
+    if slower:
+        print(f"PARAPHRASE TIME GREW {growth:.1f}x with vocabulary size")
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'results': results}, f, indent=2)
+        print(f"Wrote {args.output}")
+    return 1 if slower else 0
+
+
+def checkpoint_path(args):
+    """Return the checkpoint to benchmark, building the tiny local one if needed."""
+    checkpoint = args.checkpoint
+    if checkpoint is None:
+        checkpoint = default_checkpoint_path()
+        if not os.path.isdir(checkpoint):
+            make_tiny_checkpoint(checkpoint)
+            print(f"Built a tiny T5 checkpoint in {checkpoint}")
+    return checkpoint
+
+
+def run_ml_profiles(args):
+    checkpoint = checkpoint_path(args)
+    results = run_ml(checkpoint, args.profiles, args.min_time, args.threads, args.compile)
+    print(f"{'benchmark':<40} {'calls/s':>10} {'p50 ms':>10} {'p95 ms':>10} {'agreement':>10}")
+    for name, result in results.items():
+        print(f"{name:<40} {result['throughput']:>10.1f} {result['p50_ms']:>10.3f} "
+              f"{result['p95_ms']:>10.3f} {result['agreement']:>10.2f}")
+    print(f"agreement: mean word-level similarity of outputs to the {REFERENCE_PROFILE} profile's")
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'meta': {'checkpoint': checkpoint}, 'results': results}, f, indent=2)
+        print(f"Wrote {args.output}")
+    return 0
+
+
+def run_ml_batching(args):
+    checkpoint = checkpoint_path(args)
+    results = run_batching(checkpoint, args.profiles, args.sentences)
+    for name, result in results.items():
+        for text, batched, alone in result['examples']:
+            print(f"DIFFERS {name} on {text!r}: batched {batched!r}, alone {alone!r}")
+    print(f"{'profile':<12} {'sentences':>10} {'differ':>10} {'agreement':>10}")
+    for name, result in results.items():
+        print(f"{name:<12} {result['sentences']:>10} {result['mismatches']:>10} {result['agreement']:>10.2f}")
+    print("agreement: mean word-level similarity of batched outputs to one-at-a-time outputs")
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'meta': {'checkpoint': checkpoint}, 'results': results}, f, indent=2)
+        print(f"Wrote {args.output}")
+    return 0
+
+
+def run_ml_memo(args):
+    checkpoint = checkpoint_path(args)
+    results = run_memo(checkpoint, args.documents, args.batch_size, args.profile)
+    print(f"{'run':<12} {'sentences':>10} {'to model':>10} {'seconds':>10}")
+    for name, result in results.items():
+        print(f"{name:<12} {result['sentences']:>10} {result['model_sentences']:>10} {result['seconds']:>10.2f}")
+    for name, result in results.items():
+        print(f"{name}: the model was given {result['sentences'] / max(result['model_sentences'], 1):.1f}x "
+              f"fewer sentences than the corpus has")
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'meta': {'checkpoint': checkpoint}, 'results': results}, f, indent=2)
+        print(f"Wrote {args.output}")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='python -m benchmarks', description="Paraphraser benchmarks.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = subparsers.add_parser('run', help="run the benchmarks")
+    run_parser.add_argument('--output', '-o', help="write results to this JSON file")
+    run_parser.add_argument('--sizes', nargs='+', choices=list(SIZES), help="corpus sizes to use (default: all)")
+    run_parser.add_argument('--min-time', type=float, default=1.0, help="seconds to spend on each microbenchmark")
+    run_parser.add_argument('--skip-load', action='store_true', help="skip the HTTP load test")
+    run_parser.add_argument('--url', help="load test a running server instead of the in-process test client")
+    run_parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 8], help="concurrent clients")
+    run_parser.add_argument('--requests', type=int, default=500, help="requests per load test")
+    run_parser.set_defaults(handler=run)
+
+    compare_parser = subparsers.add_parser('compare', help="compare results against a baseline")
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('current')
+    compare_parser.add_argument('--threshold', type=float, default=0.10,
+                                help="allowed relative slowdown before flagging (default 0.10)")
+    compare_parser.set_defaults(handler=run_compare)
+
+    transformations_parser = subparsers.add_parser(
+        'transformations', help="fuzz the sentence transformations against re.sub and time pathological inputs")
+    transformations_parser.add_argument('--iterations', type=int, default=10000, help="random segments to fuzz")
+    transformations_parser.add_argument('--seed', type=int, default=0, help="seed for the fuzzer")
+    transformations_parser.add_argument('--min-time', type=float, default=0.2, help="seconds to spend on each input")
+    transformations_parser.add_argument('--output', '-o', help="write results to this JSON file")
+    transformations_parser.set_defaults(handler=run_transformation_checks)
+
+    matcher_parser = subparsers.add_parser(
+        'matcher', help="fuzz the lexicon matcher against a reference and time it per segment")
+    matcher_parser.add_argument('--iterations', type=int, default=10000, help="random segments to fuzz")
+    matcher_parser.add_argument('--seed', type=int, default=0, help="seed for the fuzzer")
+    matcher_parser.add_argument('--repeats', type=int, default=20, help="timed passes over the segments")
+    matcher_parser.add_argument('--output', '-o', help="write results to this JSON file")
+    matcher_parser.set_defaults(handler=run_matcher_checks)
+
+    sessions_parser = subparsers.add_parser(
+        'sessions', help="check incremental editing sessions against whole texts and time keystrokes")
+    sessions_parser.add_argument('--documents', type=int, default=100, help="random documents to edit")
+    sessions_parser.add_argument('--edits', type=int, default=20, help="rounds of edits per document")
+    sessions_parser.add_argument('--seed', type=int, default=0, help="seed for the fuzzer")
+    sessions_parser.add_argument('--min-time', type=float, default=1.0, help="seconds to spend on each document size")
+    sessions_parser.add_argument('--output', '-o', help="write results to this JSON file")
+    sessions_parser.set_defaults(handler=run_session_checks)
+
+    domains_parser = subparsers.add_parser(
+        'domains', help="check that domain routing doesn't slow down as the domain vocabularies grow")
+    domains_parser.add_argument('--min-time', type=float, default=1.0, help="seconds to spend on each vocabulary size")
+    domains_parser.add_argument('--output', '-o', help="write results to this JSON file")
+    domains_parser.set_defaults(handler=run_domain_checks)
+
+    ml_parser = subparsers.add_parser(
+        'ml', help="compare the latency and outputs of the ML inference profiles (needs torch and transformers)")
+    ml_parser.add_argument('--checkpoint', help="model name or path (default: a tiny local T5, built on first use)")
+    ml_parser.add_argument('--profiles', nargs='+', choices=list(PROFILES), help="inference profiles to run (default: all)")
+    ml_parser.add_argument('--min-time', type=float, default=2.0, help="seconds to spend on each benchmark")
+    ml_parser.add_argument('--threads', type=int, help="torch intra-op threads (default: torch's default)")
+    ml_parser.add_argument('--compile', action='store_true', help="run every profile's model through torch.compile")
+    ml_parser.add_argument('--output', '-o', help="write results to this JSON file")
+    ml_parser.set_defaults(handler=run_ml_profiles)
+
+    batching_parser = subparsers.add_parser(
+        'ml-batching', help="compare the ML engine's batched outputs with its one-at-a-time outputs")
+    batching_parser.add_argument('--checkpoint', help="model name or path (default: a tiny local T5, built on first use)")
+    batching_parser.add_argument('--profiles', nargs='+', choices=list(PROFILES),
+                                 help="inference profiles to run (default: all)")
+    batching_parser.add_argument('--sentences', type=int, default=BATCHING_SENTENCES, help="sentences to compare")
+    batching_parser.add_argument('--output', '-o', help="write results to this JSON file")
+    batching_parser.set_defaults(handler=run_ml_batching)
+
+    memo_parser = subparsers.add_parser(
+        'ml-memo', help="count the sentences the ML model is given with and without the sentence memo")
+    memo_parser.add_argument('--checkpoint', help="model name or path (default: a tiny local T5, built on first use)")
+    memo_parser.add_argument('--profile', choices=list(PROFILES), default=REFERENCE_PROFILE, help="inference profile")
+    memo_parser.add_argument('--documents', type=int, default=MEMO_DOCUMENTS, help="documents in the corpus")
+    memo_parser.add_argument('--batch-size', type=int, default=MEMO_BATCH_SIZE, help="documents per call")
+    memo_parser.add_argument('--output', '-o', help="write results to this JSON file")
+    memo_parser.set_defaults(handler=run_ml_memo)
+
+    args = parser.parse_args()
+    sys.exit(args.handler(args))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+"""Synthetic, lexicon-dense text for benchmarking."""
+import random
+
+from lexicon import load_domain_lexicon, load_lexicon
+
+# Filler words mixed in so that roughly half of the words hit the lexicon
+FILLER_WORDS = [
+    'the', 'a', 'of', 'in', 'for', 'with', 'to', 'is', 'are', 'was', 'that', 'this',
+    'system', 'new', 'each', 'many', 'across', 'between', 'while', 'under',
+]
+
+# Domain lexicons whose terms are mixed in with the general lexicon's
+CORPUS_DOMAINS = ('energy', 'it')
+
+# Named corpus sizes, in characters
+SIZES = {
+    'sentence': 100,
+    'paragraph': 1000,
+    '10kb': 10 * 1024,
+    '100kb': 100 * 1024,
+    '1mb': 1024 * 1024,
+}
+
+
+def make_sentence(rng, keys, min_words=8, max_words=24):
+    """Build one sentence alternating lexicon entries and filler words."""
+    words = []
+    for _ in range(rng.randint(min_words, max_words)):
+        words.append(rng.choice(keys) if rng.random() < 0.5 else rng.choice(FILLER_WORDS))
+    # Throw in the conjunctions and passive forms the sentence transformations look for
+    if rng.random() < 0.3:
+        words.insert(len(words) // 2, 'and')
+    if rng.random() < 0.2:
+        words.insert(len(words) // 2, 'is organized by')
+    sentence = ' '.join(words)
+    return sentence[0].upper() + sentence[1:] + rng.choice('...!?')
+
+
+def make_text(size, seed=0, lexicon='enhanced', domains=CORPUS_DOMAINS):
+    """Return about size characters of lexicon-dense text, the same for a given seed."""
+    rng = random.Random(seed)
+    keys = set(load_lexicon(lexicon))
+    for domain in domains:
+        keys.update(load_domain_lexicon(domain))
+    keys = sorted(keys)
+    sentences = []
+    length = 0
+    while length < size:
+        sentence = make_sentence(rng, keys)
+        sentences.append(sentence)
+        length += len(sentence) + 1
+    return ' '.join(sentences)
+
+
+def make_corpus(sizes=None, seed=0):
+    """Return {size name: text} for the named sizes (all of SIZES by default)."""
+    sizes = sizes or list(SIZES)
+    return {name: make_text(SIZES[name], seed) for name in sizes}
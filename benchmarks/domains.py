@@ -0,0 +1,59 @@
+"""Checks that domain routing doesn't slow down as the domain vocabularies grow."""
+import json
+import os
+import random
+import shutil
+import tempfile
+
+from enhanced_paraphraser import EnhancedParaphraser
+from lexicon import domain_sources
+
+from benchmarks.corpus import SIZES, make_text
+from benchmarks.micro import time_calls
+
+# Total made-up terms across the synthetic domains, smallest to largest
+VOCABULARY_SIZES = [1000, 100000]
+SYNTHETIC_DOMAINS = 20
+# Real words each synthetic domain also defines, so they compete for the
+# documents' votes
+SHARED_TERMS = 5
+# Largest allowed ratio of paraphrase time with the largest vocabulary to that with the smallest
+VOCABULARY_TOLERANCE = 2.0
+SEED = 0
+
+
+def make_domains(directory, vocabulary_size, seed=0):
+    """Create a domain directory: the real domain lexicons plus synthetic ones with vocabulary_size terms in all."""
+    os.makedirs(directory)
+    for source in domain_sources().values():
+        shutil.copy(source, directory)
+    rng = random.Random(seed)
+    real_terms = sorted({term for source in domain_sources().values() for term in json.load(open(source))})
+    per_domain = vocabulary_size // SYNTHETIC_DOMAINS
+    for domain in range(SYNTHETIC_DOMAINS):
+        entries = {f'term{domain}x{i}': [f'alternative{domain}x{i}'] for i in range(per_domain)}
+        for term in rng.sample(real_terms, SHARED_TERMS):
+            entries[term] = [f'{term} ({domain})']
+        with open(os.path.join(directory, f'synthetic{domain}.json'), 'w') as f:
+            json.dump(entries, f)
+    return directory
+
+
+def run_domains(min_time=1.0, sizes=None):
+    """Time paraphrasing paragraphs with domain vocabularies of each size.
+
+    Returns the results, and the ratio of the median time with the largest
+    vocabulary to that with the smallest.
+    """
+    texts = [make_text(SIZES['paragraph'], seed) for seed in range(16)]
+    results = {}
+    medians = []
+    with tempfile.TemporaryDirectory() as root:
+        for size in sorted(sizes or VOCABULARY_SIZES):
+            paraphraser = EnhancedParaphraser(domain_dir=make_domains(os.path.join(root, f'domains{size}'), size))
+            # The first call compiles the lexicons and the index
+            paraphraser.paraphrase(texts[0], SEED)
+            result = results[f'domains.paraphrase[{size} terms]'] = time_calls(
+                lambda text: paraphraser.paraphrase(text, SEED), texts, min_time)
+            medians.append(result['p50_ms'])
+    return results, medians[-1] / medians[0]
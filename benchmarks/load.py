@@ -0,0 +1,87 @@
+"""Concurrent load driver for the /paraphrase HTTP endpoint."""
+import contextlib
+import io
+import itertools
+import json
+import threading
+import time
+import urllib.error
+import urllib.request
+
+from benchmarks.stats import summarize
+
+
+def _test_client_sender():
+    """Return a function that posts JSON through the Flask test client."""
+    from app import app
+
+    local = threading.local()
+
+    def send(endpoint, payload):
+        client = getattr(local, 'client', None)
+        if client is None:
+            client = local.client = app.test_client()
+        return client.post(endpoint, json=payload).status_code
+
+    return send
+
+
+def _http_sender(base_url):
+    """Return a function that posts JSON to a running server."""
+    def send(endpoint, payload):
+        request = urllib.request.Request(
+            base_url.rstrip('/') + endpoint,
+            data=json.dumps(payload).encode('utf-8'),
+            headers={'Content-Type': 'application/json'},
+        )
+        try:
+            with urllib.request.urlopen(request) as response:
+                response.read()
+                return response.status
+        except urllib.error.HTTPError as e:
+            return e.code
+
+    return send
+
+
+def run_load(texts, concurrency=8, requests=200, url=None, endpoint='/paraphrase'):
+    """Send requests POSTs from concurrency threads and summarize their latencies.
+
+    Requests go to a server at url, or through the Flask test client in this
+    process when url is None.  The texts are sent in turn.
+    """
+    send = _http_sender(url) if url else _test_client_sender()
+    counter = itertools.count()
+    lock = threading.Lock()
+    latencies = []
+    statuses = {}
+    characters = [0]
+
+    def worker():
+        while True:
+            index = next(counter)
+            if index >= requests:
+                return
+            text = texts[index % len(texts)]
+            start = time.perf_counter()
+            status = send(endpoint, {'text': text})
+            latency = time.perf_counter() - start
+            with lock:
+                latencies.append(latency)
+                statuses[status] = statuses.get(status, 0) + 1
+                characters[0] += len(text)
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    # The app logs every request to stdout; keep that out of the report
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+
+    summary = summarize(latencies, elapsed, characters[0])
+    summary['concurrency'] = concurrency
+    summary['statuses'] = {str(status): count for status, count in sorted(statuses.items())}
+    return summary
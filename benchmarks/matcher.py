@@ -0,0 +1,191 @@
+"""Fuzzing and per-segment benchmarks for LexiconMatcher."""
+import random
+import re
+import time
+
+from enhanced_paraphraser import EnhancedParaphraser
+from lexicon import PREFIX, TERMINAL, load_lexicon
+from lexicon_matcher import SEPARATORS, LexiconMatcher, _lower_aligned
+
+from benchmarks.corpus import make_text
+
+# Fuzzing vocabulary besides the lexicon's own words: near misses, words
+# shared by several phrases and odd characters
+FUZZ_WORDS = ['', 'of', 'the', 'aim', 'aims', 'there', 'are', 'based', 'on', 'x', 'cloud-based', 'İ', 'naïve', '42']
+FUZZ_SEPARATORS = [' ', ' ', ' ', '  ', '\t', '\n', ', ', ',', '. ', '.', '(', ') ', '"', '-', '—', ' ']
+
+# Corpus size split into segments for the per-segment timings
+SEGMENT_CORPUS_SIZE = 100 * 1024
+# Everyday words the prose segments are made of, with one lexicon word each
+PROSE_WORDS = ("the report was written over several weeks and reviewed by a team of editors "
+               "who checked every line").split()
+# Punctuation the old loop stripped from words, and kept at their end
+STRIP_CHARS = '.,;:!?()"\''
+TRAILING_CHARS = ',.:;!?()"\'-'
+
+# A word as the reference matcher sees it: a run of characters that are
+# neither whitespace nor separators
+REFERENCE_WORD = re.compile(r'[^\s' + re.escape(''.join(sorted(SEPARATORS))) + ']+')
+
+
+def reference_finditer(lexicon, text):
+    """Return the matches LexiconMatcher.finditer should find, the slow and obvious way.
+
+    Every word is looked up on its own, and a phrase is extended one word at
+    a time while only whitespace separates its words; the longest match at
+    each word wins, and the search goes on after its end.
+    """
+    lowered = _lower_aligned(text)
+    words = [(match.start(), match.end(), match.group()) for match in REFERENCE_WORD.finditer(lowered)]
+    matches = []
+    i = 0
+    while i < len(words):
+        best = None
+        phrase = words[i][2]
+        j = i
+        while True:
+            flags = lexicon.lookup(phrase)[0]
+            if flags & TERMINAL:
+                best = (j, phrase)
+            if not flags & PREFIX or j + 1 == len(words):
+                break
+            gap = lowered[words[j][1]:words[j + 1][0]]
+            if not gap or not gap.isspace():
+                break
+            j += 1
+            phrase += ' ' + words[j][2]
+        if best is None:
+            i += 1
+            continue
+        j, phrase = best
+        matches.append((words[i][0], words[j][1], phrase))
+        i = j + 1
+    return matches
+
+
+def check_spans(matches, text):
+    """Return a description of what is wrong with matches, or None if they are sorted, disjoint and in text."""
+    end = 0
+    for start, stop, key in matches:
+        if start < end:
+            return f"span ({start}, {stop}, {key!r}) starts before the previous one ends at {end}"
+        if not start < stop <= len(text):
+            return f"span ({start}, {stop}, {key!r}) is outside the text"
+        if _lower_aligned(text[start:stop]).split() != key.split():
+            return f"span ({start}, {stop}, {key!r}) covers {text[start:stop]!r}"
+        end = stop
+    return None
+
+
+def make_fuzz_text(rng, vocabulary, max_words=40):
+    """Build a random segment from vocabulary, with random case and separators."""
+    pieces = []
+    for _ in range(rng.randint(0, max_words)):
+        word = rng.choice(vocabulary)
+        if rng.random() < 0.2:
+            word = word.upper() if rng.random() < 0.5 else word.capitalize()
+        pieces.append(word)
+        pieces.append(rng.choice(FUZZ_SEPARATORS))
+    return ''.join(pieces)
+
+
+def fuzz(iterations=10000, seed=0):
+    """Check LexiconMatcher.finditer against reference_finditer on random segments.
+
+    The same matcher is used throughout, so the lexicon's record cache is
+    exercised too.  Returns a list of (text, expected, actual, problem) for each
+    mismatch, where problem is None unless the spans themselves are wrong.
+    """
+    rng = random.Random(seed)
+    lexicon = load_lexicon('enhanced')
+    matcher = LexiconMatcher(lexicon)
+    # Every key and every run of words in the phrases, so that phrases are
+    # often cut short, run on or broken up by punctuation
+    vocabulary = set(FUZZ_WORDS)
+    for key in lexicon:
+        words = key.split()
+        vocabulary.update(' '.join(words[i:j]) for i in range(len(words)) for j in range(i + 1, len(words) + 1))
+    vocabulary = sorted(vocabulary)
+    mismatches = []
+    for _ in range(iterations):
+        text = make_fuzz_text(rng, vocabulary)
+        expected = reference_finditer(lexicon, text)
+        actual = list(matcher.finditer(text))
+        problem = check_spans(actual, text)
+        if problem or actual != expected:
+            mismatches.append((text, expected, actual, problem))
+    return mismatches
+
+
+def make_segments():
+    """Return {name: segments}: benchmark corpus segments, and as many of plain prose."""
+    paraphraser = EnhancedParaphraser()
+    dense = paraphraser.get_segments(make_text(SEGMENT_CORPUS_SIZE))
+    rng = random.Random(5)
+    keys = sorted(paraphraser.lexicon)
+    prose = []
+    for _ in range(len(dense)):
+        words = [rng.choice(PROSE_WORDS) for _ in range(rng.randint(8, 25))]
+        words[rng.randrange(len(words))] = rng.choice(keys)
+        prose.append(' '.join(words).capitalize() + '.')
+    return {'prose': prose, 'dense': dense}
+
+
+def split_strip_replace(segment, words, rng):
+    """Replace lexicon words the way the paraphraser did before LexiconMatcher.
+
+    Kept only as the baseline for the timings: it splits on whitespace and
+    strips punctuation from each word, so it misses phrases and words joined
+    by punctuation.
+    """
+    tokens = segment.split()
+    for i in range(len(tokens)):
+        word_lower = tokens[i].lower().strip(STRIP_CHARS)
+        if word_lower in words and rng.random() < 0.5:
+            replacement = rng.choice(words[word_lower])
+            if tokens[i][0].isupper():
+                replacement = replacement.capitalize()
+            for char in TRAILING_CHARS:
+                if tokens[i].endswith(char):
+                    replacement += char
+                    break
+            tokens[i] = replacement
+    return ' '.join(tokens)
+
+
+def _time_pass(function, segments):
+    """Return the seconds per segment of one pass of function over segments."""
+    start = time.perf_counter()
+    for segment in segments:
+        function(segment)
+    return (time.perf_counter() - start) / len(segments)
+
+
+def run_matcher(repeats=20):
+    """Time matching per segment against the old split/strip loop.
+
+    The three ways of matching are timed in turn within each repeat, and the
+    fastest pass of each is kept, so they are compared under the same load.
+    Returns {name: {'segments': n, 'baseline_us': ..., 'finditer_us': ...,
+    'replace_us': ...}}.
+    """
+    paraphraser = EnhancedParaphraser()
+    words = dict(paraphraser.lexicon)
+    results = {}
+    for name, segments in make_segments().items():
+        matcher = paraphraser.router.route(' '.join(segments))
+        rng = random.Random(0)
+
+        def choose(key, original):
+            return paraphraser.choose_replacement(key, original, rng=rng, lexicon=matcher.lexicon)
+
+        timings = {'baseline_us': float('inf'), 'finditer_us': float('inf'), 'replace_us': float('inf')}
+        for _ in range(repeats):
+            for timing, function in [
+                ('baseline_us', lambda segment: split_strip_replace(segment, words, rng)),
+                ('finditer_us', lambda segment: list(matcher.finditer(segment))),
+                ('replace_us', lambda segment: matcher.replace(segment, choose)),
+            ]:
+                timings[timing] = min(timings[timing], _time_pass(function, segments) * 1e6)
+        results[name] = {'segments': len(segments), **timings}
+    return results
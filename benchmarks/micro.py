@@ -0,0 +1,57 @@
+"""Microbenchmarks for the rule-based paraphrasing engines."""
+import random
+import time
+
+from enhanced_paraphraser import EnhancedParaphraser
+import scoring
+from simple_paraphraser import SimpleParaphraser
+
+from benchmarks.corpus import SIZES, make_text
+from benchmarks.stats import summarize
+
+# Seed used for every call, so each run does the same work
+SEED = 0
+# Variants per paraphrase_variants call
+VARIANTS = 20
+# Candidates scored per scoring.score call, on texts up to the size the app accepts
+CANDIDATES = 50
+MAX_SCORED_LENGTH = 100 * 1024
+
+
+def time_calls(function, inputs, min_time=1.0, min_calls=5, max_calls=100000):
+    """Call function on inputs in turn until min_time and min_calls are both reached."""
+    latencies = []
+    characters = 0
+    start = time.perf_counter()
+    while len(latencies) < max_calls and (len(latencies) < min_calls or time.perf_counter() - start < min_time):
+        text = inputs[len(latencies) % len(inputs)]
+        call_start = time.perf_counter()
+        function(text)
+        latencies.append(time.perf_counter() - call_start)
+        characters += len(text)
+    return summarize(latencies, time.perf_counter() - start, characters)
+
+
+def run_micro(corpus, min_time=1.0):
+    """Benchmark each engine entry point on every text in corpus ({size name: text})."""
+    simple = SimpleParaphraser()
+    enhanced = EnhancedParaphraser()
+    results = {}
+
+    rng = random.Random(SEED)
+    segments = enhanced.get_segments(corpus.get('paragraph') or make_text(SIZES['paragraph']))
+    results['enhanced.paraphrase_segment'] = time_calls(
+        lambda segment: enhanced.paraphrase_segment(segment, rng), segments, min_time)
+
+    for name, text in corpus.items():
+        results[f'simple.paraphrase[{name}]'] = time_calls(
+            lambda text: simple.paraphrase(text, SEED), [text], min_time)
+        results[f'enhanced.paraphrase[{name}]'] = time_calls(
+            lambda text: enhanced.paraphrase(text, SEED), [text], min_time)
+        results[f'enhanced.paraphrase_variants[{name}]'] = time_calls(
+            lambda text: enhanced.paraphrase_variants(text, VARIANTS, SEED), [text], min_time)
+        if len(text) <= MAX_SCORED_LENGTH:
+            candidates = enhanced.paraphrase_variants(text, CANDIDATES, SEED)
+            results[f'scoring.score[{name}]'] = time_calls(
+                lambda text: scoring.score(text, candidates), [text], min_time)
+    return results
@@ -0,0 +1,207 @@
+"""Latency and output agreement of the ML engine's inference profiles.
+
+The benchmark runs on a small, randomly initialized T5 checkpoint built
+locally, so it needs torch and transformers but no download.  Its outputs are
+meaningless, but each profile's outputs are compared with those of the quality
+profile to show how much faster decoding changes them.  Pass the name or path
+of a real checkpoint to measure the quality trade-off properly.
+"""
+import copy
+import difflib
+import os
+import random
+import re
+import tempfile
+import time
+
+from cache import LRUCache, ParaphraseCache
+import enhanced_paraphraser
+import paraphraser_example
+
+from benchmarks.corpus import SIZES, make_text
+from benchmarks.micro import time_calls
+
+# Size of the local checkpoint: a scaled-down T5 with the same architecture
+TINY_T5_CONFIG = dict(d_model=256, d_ff=1024, num_layers=4, num_heads=4, d_kv=64)
+SPECIAL_TOKENS = ['<pad>', '</s>', '<unk>']
+# Profile every other profile's outputs are compared with
+REFERENCE_PROFILE = 'quality'
+
+# Sentences compared batched and one at a time, and mismatches shown per profile
+BATCHING_SENTENCES = 48
+BATCHING_EXAMPLES = 3
+
+# Memo benchmark corpus: documents made of boilerplate sentences shared by
+# all of them and sentences of their own, paraphrased a batch at a time
+MEMO_DOCUMENTS = 200
+MEMO_BATCH_SIZE = 8
+BOILERPLATE_SENTENCES = 12
+BOILERPLATE_PER_DOCUMENT = 4
+UNIQUE_PER_DOCUMENT = 1
+
+
+def make_tiny_checkpoint(path, seed=0):
+    """Save a randomly initialized T5 model, with a word-level tokenizer for the benchmark corpus, to path."""
+    import torch
+    from tokenizers import Tokenizer, models, normalizers, pre_tokenizers
+    from transformers import PreTrainedTokenizerFast, T5Config, T5ForConditionalGeneration
+
+    words = sorted(set(re.findall(r'\w+|[^\w\s]', make_text(SIZES['100kb'], seed).lower())))
+    vocabulary = {token: i for i, token in enumerate(SPECIAL_TOKENS + ['paraphrase', ':'] + words)}
+    tokenizer = Tokenizer(models.WordLevel(vocabulary, unk_token='<unk>'))
+    tokenizer.normalizer = normalizers.Lowercase()
+    tokenizer.pre_tokenizer = pre_tokenizers.Sequence([pre_tokenizers.WhitespaceSplit(), pre_tokenizers.Punctuation()])
+    PreTrainedTokenizerFast(
+        tokenizer_object=tokenizer, pad_token='<pad>', eos_token='</s>', unk_token='<unk>').save_pretrained(path)
+
+    torch.manual_seed(seed)
+    config = T5Config(vocab_size=len(vocabulary), decoder_start_token_id=0, pad_token_id=0, eos_token_id=1,
+                      **TINY_T5_CONFIG)
+    T5ForConditionalGeneration(config).save_pretrained(path)
+    return path
+
+
+def load_checkpoint(name_or_path):
+    """Load a tokenizer and model by Hugging Face name or local path."""
+    from transformers import AutoModelForSeq2SeqLM, AutoTokenizer
+    return AutoModelForSeq2SeqLM.from_pretrained(name_or_path), AutoTokenizer.from_pretrained(name_or_path)
+
+
+def agreement(reference, outputs):
+    """Mean word-level similarity (0 to 1) of outputs to the reference outputs."""
+    ratios = [difflib.SequenceMatcher(None, expected.split(), actual.split()).ratio()
+              for expected, actual in zip(reference, outputs)]
+    return sum(ratios) / len(ratios)
+
+
+def run_ml(checkpoint, profiles=None, min_time=1.0, threads=None, compile=False):
+    """Benchmark each inference profile (all of PROFILES by default) on checkpoint.
+
+    Times one sentence at a time and a paragraph through paraphrase_documents,
+    and returns {benchmark name: result}, where each profile's results also
+    give the agreement of its outputs with the reference profile's.  compile
+    turns on torch.compile for every profile.
+    """
+    # The reference profile runs first, so the others can be compared with it
+    profiles = [REFERENCE_PROFILE] + [name for name in profiles or paraphraser_example.PROFILES
+                                      if name != REFERENCE_PROFILE]
+    model, tokenizer = load_checkpoint(checkpoint)
+    paragraph = make_text(SIZES['paragraph'], seed=1)
+    sentences = enhanced_paraphraser.get_paraphraser().get_segments(paragraph)
+
+    results = {}
+    reference = None
+    for name in profiles:
+        profile = dict(paraphraser_example.PROFILES[name], compile=compile)
+        # Compiling replaces the model's forward method, so give each profile its own copy
+        prepared = paraphraser_example.prepare_model(copy.deepcopy(model), profile, threads)
+        worker = paraphraser_example.InferenceWorker(
+            prepared, tokenizer, generation_kwargs=profile['generation_kwargs'])
+        try:
+            # The first call pays for compilation and lazy initialization
+            outputs = worker.paraphrase_documents(sentences)
+            if reference is None:
+                reference = outputs
+            sentence = time_calls(worker.paraphrase, sentences, min_time)
+            document = time_calls(lambda text: worker.paraphrase_documents([text]), [paragraph], min_time)
+        finally:
+            worker.close()
+        sentence['agreement'] = document['agreement'] = agreement(reference, outputs)
+        results[f'ml.{name}[sentence]'] = sentence
+        results[f'ml.{name}[paragraph]'] = document
+    return results
+
+
+def run_batching(checkpoint, profiles=None, sentences=BATCHING_SENTENCES):
+    """Compare each inference profile's batched outputs with its one-at-a-time outputs on checkpoint.
+
+    The sentences, of mixed lengths, are submitted together, so the worker
+    pads them into shared batches, and then one at a time, each in a batch
+    of its own.  Returns {profile: {'sentences', 'mismatches', 'agreement',
+    'examples'}}, where examples lists (sentence, batched, alone) for up to
+    BATCHING_EXAMPLES of the sentences whose outputs differ.
+    """
+    model, tokenizer = load_checkpoint(checkpoint)
+    text = make_text(SIZES['paragraph'] * 6, seed=2)
+    results = {}
+    for name in profiles or paraphraser_example.PROFILES:
+        profile = paraphraser_example.PROFILES[name]
+        prepared = paraphraser_example.prepare_model(copy.deepcopy(model), profile)
+        worker = paraphraser_example.InferenceWorker(
+            prepared, tokenizer, generation_kwargs=profile['generation_kwargs'])
+        try:
+            texts = [sentence for sentence, _ in worker.split(text)][:sentences]
+            batched = worker.paraphrase_many(texts)
+            alone = [worker.paraphrase(text) for text in texts]
+        finally:
+            worker.close()
+        differ = [(text, output, expected) for text, output, expected in zip(texts, batched, alone)
+                  if output != expected]
+        results[name] = {
+            'sentences': len(texts),
+            'mismatches': len(differ),
+            'agreement': agreement(alone, batched),
+            'examples': differ[:BATCHING_EXAMPLES],
+        }
+    return results
+
+
+def default_checkpoint_path():
+    """Location of the local checkpoint, which is built on first use and kept between runs."""
+    return os.path.join(tempfile.gettempdir(), 'paraphraser_tiny_t5')
+
+
+def make_memo_corpus(documents=MEMO_DOCUMENTS, seed=0):
+    """Return documents sharing boilerplate sentences, some with their whitespace changed."""
+    rng = random.Random(seed)
+    segments = enhanced_paraphraser.get_paraphraser().get_segments
+    boilerplate = segments(make_text(SIZES['paragraph'] * 4, seed=seed + 1))[:BOILERPLATE_SENTENCES]
+    corpus = []
+    for document in range(documents):
+        sentences = rng.sample(boilerplate, BOILERPLATE_PER_DOCUMENT)
+        sentences += segments(make_text(1, seed=seed + 2 + document))[:UNIQUE_PER_DOCUMENT]
+        rng.shuffle(sentences)
+        # Normalization makes these the same sentence as the original
+        sentences = [sentence.replace(' ', '  ', 1) if rng.random() < 0.2 else sentence for sentence in sentences]
+        corpus.append(' '.join(sentences))
+    return corpus
+
+
+def run_memo(checkpoint, documents=MEMO_DOCUMENTS, batch_size=MEMO_BATCH_SIZE, profile=REFERENCE_PROFILE):
+    """Paraphrase a corpus with repeated boilerplate with and without the sentence memo.
+
+    The documents go through paraphrase_documents batch_size at a time, so
+    without the memo only sentences repeated within a batch are deduplicated.
+    Returns {'no memo' or 'memo': {'sentences', 'model_sentences', 'seconds'}}.
+    """
+    model, tokenizer = load_checkpoint(checkpoint)
+    settings = paraphraser_example.PROFILES[profile]
+    model = paraphraser_example.prepare_model(model, settings)
+    corpus = make_memo_corpus(documents)
+    sentences = sum(len(enhanced_paraphraser.get_paraphraser().get_segments(text)) for text in corpus)
+
+    results = {}
+    for name, memo in [('no memo', None), ('memo', ParaphraseCache(LRUCache(max_size=paraphraser_example.MEMO_SIZE)))]:
+        worker = paraphraser_example.InferenceWorker(
+            model, tokenizer, generation_kwargs=settings['generation_kwargs'], memo=memo)
+        model_sentences = 0
+        paraphrase_many = worker.paraphrase_many
+
+        def counted(texts, timeout=None):
+            nonlocal model_sentences
+            model_sentences += len(texts)
+            return paraphrase_many(texts, timeout)
+
+        worker.paraphrase_many = counted
+        try:
+            # Load lazily initialized state before timing
+            worker.paraphrase(paraphraser_example.WARM_UP_TEXT)
+            model_sentences = 0
+            start = time.perf_counter()
+            for i in range(0, len(corpus), batch_size):
+                worker.paraphrase_documents(corpus[i:i + batch_size])
+            seconds = time.perf_counter() - start
+        finally:
+            worker.close()
+        results[name] = {'sentences': sentences, 'model_sentences': model_sentences, 'seconds': seconds}
+    return results
@@ -0,0 +1,80 @@
+"""Consistency checks and per-keystroke timings for incremental editing sessions."""
+import random
+import time
+
+from enhanced_paraphraser import EnhancedParaphraser
+from sessions import EditingSession
+
+from benchmarks.corpus import make_text
+from benchmarks.stats import summarize
+
+# Text typed or pasted by the fuzzer: sentence ends, whitespace and words
+FUZZ_PIECES = ['. ', ' ', 'x', 'and ', 'Cloud data! ', '\n', '?  ', 'word', '.', '  ', 'é']
+DOCUMENT_SIZES = [1024, 10 * 1024, 100 * 1024]
+# Largest allowed ratio of keystroke time on the biggest document to that on the smallest
+SIZE_TOLERANCE = 4.0
+SEED = 0
+
+
+def random_edit(rng, text):
+    """Return a random edit of text, as {'start', 'end', 'text'}."""
+    start = rng.randint(0, len(text))
+    end = min(len(text), start + rng.choice([0, 0, 1, 3, 20]))
+    replacement = ''.join(rng.choice(FUZZ_PIECES) for _ in range(rng.randint(0, 3)))
+    return {'start': start, 'end': end, 'text': replacement}
+
+
+def fuzz(documents=100, edits=20, seed=0):
+    """Edit random documents and check each version against a session given the whole text.
+
+    Returns a list of (text, edits) for each version where the session's
+    segments or the segments rebuilt from its changes differ.
+    """
+    paraphraser = EnhancedParaphraser()
+    rng = random.Random(seed)
+    mismatches = []
+    for document in range(documents):
+        session = EditingSession(paraphraser, SEED)
+        outputs = session.set_text(make_text(rng.randint(0, 1000), seed=document))['segments']
+        for _ in range(edits):
+            text = session.text
+            batch = []
+            for _ in range(rng.randint(1, 3)):
+                edit = random_edit(rng, text)
+                text = text[:edit['start']] + edit['text'] + text[edit['end']:]
+                batch.append(edit)
+            change = session.apply_edits(batch, session.version)
+            outputs[change['start']:change['end']] = change['segments']
+
+            reference = EditingSession(paraphraser, SEED)
+            reference.set_text(text)
+            if session.text != text or session.outputs != reference.outputs or outputs != reference.outputs:
+                mismatches.append((text, batch))
+                break
+    return mismatches
+
+
+def run_sessions(min_time=1.0, sizes=None):
+    """Time one-character edits in the middle of documents of each size.
+
+    Returns the results, and the ratio of the median keystroke time on the
+    largest document to that on the smallest.
+    """
+    paraphraser = EnhancedParaphraser()
+    sizes = sorted(sizes or DOCUMENT_SIZES)
+    results = {}
+    medians = []
+    for size in sizes:
+        session = EditingSession(paraphraser, SEED)
+        session.set_text(make_text(size))
+        position = len(session.text) // 2
+        latencies = []
+        start = time.perf_counter()
+        while len(latencies) < 5 or time.perf_counter() - start < min_time:
+            call_start = time.perf_counter()
+            session.apply_edits([{'start': position, 'end': position, 'text': 'a'}], session.version)
+            latencies.append(time.perf_counter() - call_start)
+            position += 1
+        result = results[f'session.keystroke[{size}]'] = summarize(latencies, time.perf_counter() - start)
+        medians.append(result['p50_ms'])
+    return results, medians[-1] / medians[0]
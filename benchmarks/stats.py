@@ -0,0 +1,51 @@
+"""Latency summaries and baseline comparison for benchmark results."""
+import math
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return float('nan')
+    index = max(0, math.ceil(fraction * len(sorted_values)) - 1)
+    return sorted_values[index]
+
+
+def summarize(latencies, elapsed, characters=None):
+    """Summarize per-call latencies (seconds) measured over elapsed wall time.
+
+    Returns throughput in calls per second (and characters per second when
+    characters, the total input processed, is given) and p50/p95/p99/max
+    latencies in milliseconds.
+    """
+    ordered = sorted(latencies)
+    summary = {
+        'calls': len(ordered),
+        'throughput': len(ordered) / elapsed if elapsed > 0 else float('inf'),
+        'p50_ms': percentile(ordered, 0.50) * 1000,
+        'p95_ms': percentile(ordered, 0.95) * 1000,
+        'p99_ms': percentile(ordered, 0.99) * 1000,
+        'max_ms': ordered[-1] * 1000 if ordered else float('nan'),
+    }
+    if characters is not None:
+        summary['chars_per_second'] = characters / elapsed if elapsed > 0 else float('inf')
+    return summary
+
+
+def compare(baseline, current, threshold=0.10):
+    """Compare two result dicts and return a list of regressions.
+
+    A benchmark regresses when its throughput drops, or its p50 or p99 latency
+    rises, by more than threshold (a fraction) relative to the baseline.
+    Each regression is (benchmark, metric, baseline value, current value).
+    """
+    regressions = []
+    for name, before in baseline['results'].items():
+        after = current['results'].get(name)
+        if after is None:
+            continue
+        if after['throughput'] < before['throughput'] * (1 - threshold):
+            regressions.append((name, 'throughput', before['throughput'], after['throughput']))
+        for metric in ('p50_ms', 'p99_ms'):
+            if after[metric] > before[metric] * (1 + threshold):
+                regressions.append((name, metric, before[metric], after[metric]))
+    return regressions
@@ -0,0 +1,129 @@
+"""Fuzzing and pathological-input benchmarks for the sentence transformations."""
+import random
+import re
+import time
+
+from enhanced_paraphraser import EnhancedParaphraser
+from simple_paraphraser import SimpleParaphraser
+
+from benchmarks.micro import time_calls
+
+# The regular expressions each engine's transformations replace, in the same order
+ENHANCED_PATTERNS = [
+    (r'is ([\w]+ed) by', r'actively \1'),
+    (r'([\w]+) ([\w]+s) the', r'the is \2ed by \1'),
+    (r'(.*?) is to (.*?) by (.*?)', r'\3 enables \1 to \2'),
+    (r'(.*?) and (.*?)', r'\2 and \1'),
+]
+SIMPLE_PATTERNS = [
+    (r'(\w+) and (\w+)', r'\2 and \1'),
+    (r'(\w+), (\w+), and (\w+)', r'\3, \1, and \2'),
+]
+
+# Fuzzing vocabulary: the words the patterns look for, near misses and odd characters
+FUZZ_WORDS = [
+    'is', 'to', 'by', 'bypass', 'and', 'andes', 'the', 'there', 'ed', 'organized', 'makes', 's',
+    'this', 'cats', 'co', 'op', 'é', 'naïve', '_', 'x1', '42', 'İs', '',
+]
+FUZZ_SEPARATORS = [' ', ' ', ' ', '  ', ', ', ',', '\n', '-', '. ', '\t', ' and ', ' is to ', ' by ']
+
+DENSE_TEXT = "it is organized by cats and dogs, x is to y by z, she makes the red, green, and blue plan "
+
+# Segments built to make the backtracking patterns work hardest: long runs of
+# words with a near miss of the text each pattern needs
+PATHOLOGICAL_INPUTS = {
+    'no-separators': lambda size: ('word ' * (size // 5 + 1))[:size],
+    'is-to-without-by': lambda size: ('x is to ' * (size // 8 + 1))[:size],
+    'and-at-end': lambda size: ('word ' * (size // 5 + 1))[:size - 6] + ' and x',
+    # Many matches for every transformation, so the rewriting itself is timed
+    'dense-matches': lambda size: (DENSE_TEXT * (size // len(DENSE_TEXT) + 1))[:size],
+}
+PATHOLOGICAL_SIZES = [1024, 4096, 16384, 65536]
+# Largest allowed ratio of time per character at the biggest size to that at the smallest
+LINEARITY_TOLERANCE = 4.0
+
+
+def get_transformations():
+    """Return [(name, transformation, pattern, replacement)] for both engines."""
+    enhanced = EnhancedParaphraser().sentence_transformations
+    simple = SimpleParaphraser().reorderings
+    return (
+        [(f'enhanced[{i}]', transformation, *pattern)
+         for i, (transformation, pattern) in enumerate(zip(enhanced, ENHANCED_PATTERNS))] +
+        [(f'simple[{i}]', transformation, *pattern)
+         for i, (transformation, pattern) in enumerate(zip(simple, SIMPLE_PATTERNS))]
+    )
+
+
+def make_fuzz_text(rng, max_words=40):
+    """Build a random segment from the fuzzing vocabulary."""
+    pieces = []
+    for _ in range(rng.randint(0, max_words)):
+        pieces.append(rng.choice(FUZZ_WORDS))
+        pieces.append(rng.choice(FUZZ_SEPARATORS))
+    return ''.join(pieces)
+
+
+def fuzz(iterations=10000, seed=0):
+    """Check every transformation against re.sub on random segments.
+
+    Returns a list of (name, text, expected, actual) for each mismatch.
+    """
+    rng = random.Random(seed)
+    transformations = get_transformations()
+    mismatches = []
+    for _ in range(iterations):
+        text = make_fuzz_text(rng)
+        for name, transformation, pattern, replacement in transformations:
+            expected = re.sub(pattern, replacement, text)
+            actual = transformation.apply(text)
+            if actual != expected:
+                mismatches.append((name, text, expected, actual))
+    return mismatches
+
+
+def run_transformations(min_time=1.0, sizes=None):
+    """Benchmark every transformation on each pathological input and size.
+
+    Returns the results, and a list of (name, input name, slowdown) for each
+    transformation whose time per character grows by more than
+    LINEARITY_TOLERANCE from the smallest size to the largest.
+    """
+    sizes = sorted(sizes or PATHOLOGICAL_SIZES)
+    results = {}
+    nonlinear = []
+    for name, transformation, _, _ in get_transformations():
+        for input_name, make_input in PATHOLOGICAL_INPUTS.items():
+            per_character = []
+            for size in sizes:
+                result = time_calls(transformation.apply, [make_input(size)], min_time)
+                results[f'transform.{name}[{input_name},{size}]'] = result
+                per_character.append(result['p50_ms'] / size)
+            slowdown = per_character[-1] / per_character[0]
+            if slowdown > LINEARITY_TOLERANCE:
+                nonlinear.append((name, input_name, slowdown))
+    return results, nonlinear
+
+
+def time_regex(pattern, replacement, text):
+    """Seconds one re.sub takes, for comparison with the transformations."""
+    start = time.perf_counter()
+    re.sub(pattern, replacement, text)
+    return time.perf_counter() - start
+
+
+def compare_with_regex(size=1024):
+    """Return {(name, input name): (regex seconds, transformation seconds)} at one size.
+
+    The regular expressions take time that grows with the square or cube of
+    the input on these inputs, so keep size small.
+    """
+    timings = {}
+    for name, transformation, pattern, replacement in get_transformations():
+        for input_name, make_input in PATHOLOGICAL_INPUTS.items():
+            text = make_input(size)
+            start = time.perf_counter()
+            transformation.apply(text)
+            elapsed = time.perf_counter() - start
+            timings[name, input_name] = (time_regex(pattern, replacement, text), elapsed)
+    return timings
@@ -0,0 +1,276 @@
+"""Offline bulk paraphrasing of large files.
+
+Reads records from text files (one text per line) or JSONL files (one JSON
+object per line, with the text in a field), from disk or stdin, a line at a
+time.  Records are grouped into chunks and paraphrased across a process pool
+with a bounded number of chunks in flight, and the results are written in
+input order.  Memory use depends on the chunk size and the number of workers,
+not on the size of the input.
+
+With an output file, progress is checkpointed every few seconds (the input
+position and the size of the output written so far).  Running the same
+command again after the job was killed resumes from the last checkpoint, and
+the checkpoint is removed once the job completes.
+
+    python bulk.py records.jsonl -o paraphrased.jsonl --engine enhanced
+    cat texts.txt | python bulk.py - --format text > paraphrased.txt
+"""
+import argparse
+import collections
+import importlib
+import json
+import os
+import sys
+import time
+
+import engines
+import parallel
+
+# Records per chunk sent to a worker process
+CHUNK_SIZE = 256
+# Seconds between checkpoints
+CHECKPOINT_INTERVAL = 10
+# Bytes of output buffered before writing
+OUTPUT_BUFFER_SIZE = 1 << 20
+JSONL_EXTENSIONS = ('.jsonl', '.ndjson')
+
+
+def detect_format(path):
+    """Return 'jsonl' for .jsonl and .ndjson files and 'text' for anything else (including stdin)."""
+    return 'jsonl' if path.lower().endswith(JSONL_EXTENSIONS) else 'text'
+
+
+def iter_records(paths, formats, field='text', start=(0, 0)):
+    """Yield (record, text, position) for every record in the input files, in order.
+
+    record is the parsed JSON object for JSONL input and None for text input.
+    position is (file index, byte offset) just after the record, and reading
+    can resume from one with start.  '-' reads stdin, which can't be resumed.
+    Blank lines in JSONL files are skipped.
+    """
+    file_index, offset = start
+    for index in range(file_index, len(paths)):
+        path = paths[index]
+        stdin = path == '-'
+        file = sys.stdin.buffer if stdin else open(path, 'rb')
+        try:
+            if offset:
+                file.seek(offset)
+            for line in file:
+                record_start = offset
+                offset += len(line)
+                if formats[index] == 'text':
+                    yield None, line.decode('utf-8').rstrip('\r\n'), (index, offset)
+                    continue
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError as e:
+                    raise ValueError(f"{path}: invalid JSON at byte {record_start}: {str(e)}")
+                text = record.get(field) if isinstance(record, dict) else None
+                if not isinstance(text, str):
+                    raise ValueError(f"{path}: record at byte {record_start} has no string {field!r} field")
+                yield record, text, (index, offset)
+        finally:
+            if not stdin:
+                file.close()
+        offset = 0
+
+
+def iter_chunks(records, size=CHUNK_SIZE):
+    """Group (record, text, position) tuples into lists of up to size."""
+    chunk = []
+    for item in records:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def paraphrase_chunks(engine, chunks, workers=None, seed=None):
+    """Yield (chunk, paraphrases) for each chunk, in order.
+
+    The rule-based engines spread chunks over a process pool.  The ML engine
+    runs in this process, where its inference worker batches each chunk and
+    torch uses every core.
+    """
+    if engine == 'ml':
+        import paraphraser_example
+        paraphraser_example.check_dependencies()
+        for chunk in chunks:
+            yield chunk, paraphraser_example.paraphrase_batch([text for _, text, _ in chunk])
+        return
+
+    paraphraser = importlib.import_module(engines.ENGINE_MODULES[engine]).get_paraphraser()
+    # Chunks are drawn from the input only as their results are written, so
+    # keep each one until its paraphrases come back
+    submitted = collections.deque()
+
+    def texts():
+        for chunk in chunks:
+            submitted.append(chunk)
+            yield [text for _, text, _ in chunk]
+
+    for paraphrases in parallel.paraphrase_chunks(paraphraser, texts(), workers, seed):
+        yield submitted.popleft(), paraphrases
+
+
+def format_result(record, paraphrased, output_field):
+    """Return the output line for a record: the JSON record with its paraphrase, or the paraphrase."""
+    if record is None:
+        return paraphrased + '\n'
+    record[output_field] = paraphrased
+    return json.dumps(record, ensure_ascii=False) + '\n'
+
+
+def load_checkpoint(path):
+    """Return the checkpoint saved at path, or None if there is none."""
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def save_checkpoint(path, checkpoint):
+    """Write a checkpoint atomically, so a crash never leaves a partial one."""
+    temporary = path + '.tmp'
+    with open(temporary, 'w') as f:
+        json.dump(checkpoint, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporary, path)
+
+
+def describe_input(path):
+    """Identify an input file for checkpoints, so a changed file isn't resumed by byte offset."""
+    if path == '-':
+        return {'path': path}
+    stat = os.stat(path)
+    return {'path': os.path.abspath(path), 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+def run_job(inputs, output_path=None, engine='enhanced', input_format=None, field='text',
+            output_field='paraphrased', workers=None, seed=None, chunk_size=CHUNK_SIZE,
+            checkpoint_path=None, checkpoint_interval=CHECKPOINT_INTERVAL, log=sys.stderr):
+    """Paraphrase every record in inputs into output_path (stdout if None).
+
+    Resumes from checkpoint_path (by default output_path + '.checkpoint',
+    unless reading stdin) if it exists.  Returns the number of records written, including those
+    written before resuming.
+    """
+    formats = [input_format or detect_format(path) for path in inputs]
+    job = {
+        'inputs': [describe_input(path) for path in inputs],
+        'formats': formats,
+        'field': field,
+        'output_field': output_field,
+        'engine': engine,
+        'seed': seed,
+    }
+    if output_path is None and checkpoint_path is not None:
+        raise ValueError("checkpoints need an output file")
+    if output_path is not None and checkpoint_path is None and '-' not in inputs:
+        checkpoint_path = output_path + '.checkpoint'
+    checkpoint = load_checkpoint(checkpoint_path) if checkpoint_path else None
+    if checkpoint is not None:
+        if checkpoint['job'] != job:
+            raise ValueError(f"{checkpoint_path} is for a different job or the inputs have changed; "
+                             "remove it to start over")
+        if '-' in inputs:
+            raise ValueError("a job reading stdin can't be resumed; remove the checkpoint to start over")
+        position = tuple(checkpoint['position'])
+        records_done = checkpoint['records']
+        output_offset = checkpoint['output_offset']
+        print(f"Resuming after {records_done} records", file=log)
+    else:
+        position = (0, 0)
+        records_done = 0
+        output_offset = 0
+
+    if output_path is None:
+        output = open(sys.stdout.fileno(), 'wb', buffering=OUTPUT_BUFFER_SIZE, closefd=False)
+    elif checkpoint is not None:
+        # Drop anything written after the checkpoint
+        output = open(output_path, 'r+b', buffering=OUTPUT_BUFFER_SIZE)
+        output.truncate(output_offset)
+        output.seek(output_offset)
+    else:
+        output = open(output_path, 'wb', buffering=OUTPUT_BUFFER_SIZE)
+
+    def save():
+        output.flush()
+        os.fsync(output.fileno())
+        save_checkpoint(checkpoint_path, {
+            'job': job, 'position': position, 'records': records_done, 'output_offset': output_offset})
+
+    started = time.monotonic()
+    last_checkpoint = started
+    completed = False
+    try:
+        chunks = iter_chunks(iter_records(inputs, formats, field, position), chunk_size)
+        for chunk, paraphrases in paraphrase_chunks(engine, chunks, workers, seed):
+            data = ''.join(format_result(record, paraphrased, output_field)
+                           for (record, _, _), paraphrased in zip(chunk, paraphrases)).encode('utf-8')
+            output.write(data)
+            output_offset += len(data)
+            records_done += len(chunk)
+            position = chunk[-1][2]
+
+            now = time.monotonic()
+            if checkpoint_path and now - last_checkpoint >= checkpoint_interval:
+                save()
+                last_checkpoint = now
+                print(f"{records_done} records written ({records_done / (now - started):.0f}/s)", file=log)
+        completed = True
+    finally:
+        if checkpoint_path and not completed:
+            # Keep what was written before an interruption or error
+            save()
+        output.close()
+    if checkpoint_path and os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+    return records_done
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Paraphrase text or JSONL files in bulk.")
+    parser.add_argument('inputs', nargs='+', help="input files, or - for stdin")
+    parser.add_argument('--output', '-o', help="output file (default: stdout, which can't be checkpointed)")
+    parser.add_argument('--engine', choices=list(engines.ENGINE_MODULES), default='enhanced')
+    parser.add_argument('--format', choices=['text', 'jsonl'],
+                        help="input format (default: jsonl for .jsonl and .ndjson files, otherwise text)")
+    parser.add_argument('--field', default='text', help="JSONL field holding the text (default: text)")
+    parser.add_argument('--output-field', default='paraphrased',
+                        help="JSONL field the paraphrase is written to (default: paraphrased)")
+    parser.add_argument('--workers', type=int, help="worker processes (default: one per CPU core)")
+    parser.add_argument('--seed', type=int, help="seed applied to every record, for reproducible output")
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help="records per chunk")
+    parser.add_argument('--checkpoint', help="checkpoint file (default: the output file + .checkpoint)")
+    parser.add_argument('--checkpoint-interval', type=float, default=CHECKPOINT_INTERVAL,
+                        help="seconds between checkpoints")
+    args = parser.parse_args()
+
+    started = time.monotonic()
+    try:
+        records = run_job(args.inputs, args.output, args.engine, args.format, args.field, args.output_field,
+                          args.workers, args.seed, args.chunk_size, args.checkpoint, args.checkpoint_interval)
+    except KeyboardInterrupt:
+        print("Interrupted; run the same command again to resume", file=sys.stderr)
+        sys.exit(130)
+    except (OSError, ValueError) as e:
+        print(f"Error: {str(e)}", file=sys.stderr)
+        sys.exit(1)
+    finally:
+        # Stop the workers now rather than leaving them to interpreter exit,
+        # which an interrupt can cut short
+        parallel.shutdown_pools()
+    elapsed = time.monotonic() - started
+    print(f"Paraphrased {records} records in {elapsed:.1f}s", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
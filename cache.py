@@ -0,0 +1,182 @@
+"""Two-tier cache for paraphrase results.
+
+The first tier is an in-process LRU dict, so repeat requests served by the
+same process are answered without leaving Python.  The second tier is a
+sqlite database on local disk shared by every worker process on the host, so
+a result computed by one gunicorn worker is reused by the others.
+"""
+from collections import OrderedDict
+import hashlib
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+def make_key(namespace, seed, text):
+    """Build the cache key for a text paraphrased in namespace with seed."""
+    digest = hashlib.sha256(text.encode('utf-8')).hexdigest()
+    return f"{namespace}|{seed}|{digest}"
+
+
+class LRUCache:
+    """A thread-safe in-process LRU cache with size and TTL eviction.
+
+    max_entries bounds the number of entries.  max_size, if given, also
+    bounds the total length of their keys and values, which must then be
+    strings; without it, values can be any object.
+    """
+
+    def __init__(self, max_entries=10000, ttl=3600, max_size=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_size = max_size
+        # key -> (value, expiry time, size counted against max_size)
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires, size = entry
+            if expires < time.monotonic():
+                del self._entries[key]
+                self._size -= size
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            previous = self._entries.get(key)
+            if previous is not None:
+                self._size -= previous[2]
+            size = len(key) + len(value) if self.max_size is not None else 0
+            self._entries[key] = (value, time.monotonic() + self.ttl, size)
+            self._entries.move_to_end(key)
+            self._size += size
+            while len(self._entries) > self.max_entries or \
+                    (self.max_size is not None and self._size > self.max_size):
+                self._size -= self._entries.popitem(last=False)[1][2]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+
+class SqliteCache:
+    """A cache in a local sqlite file, shared by every process that opens it.
+
+    The cache is best effort: if the database is locked or unavailable, gets
+    miss and sets are dropped instead of failing the request.  If it can't be
+    created at all, available is False and callers should do without it.
+    """
+
+    # Check the size bound every this many writes
+    PRUNE_INTERVAL = 100
+
+    def __init__(self, path, max_entries=100000, ttl=86400):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._local = threading.local()
+        self._writes = 0
+        try:
+            self._connection().execute(
+                "CREATE TABLE IF NOT EXISTS paraphrase_cache "
+                "(key TEXT PRIMARY KEY, value TEXT NOT NULL, expires REAL NOT NULL)"
+            )
+            self.available = True
+        except sqlite3.Error as e:
+            logger.warning(f"Shared cache {path} is unavailable, caching in process only: {str(e)}")
+            self.available = False
+
+    def _connection(self):
+        # sqlite connections can't be shared between threads (or forked
+        # processes), so each thread of each process opens its own
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=0.5, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    def get(self, key):
+        try:
+            row = self._connection().execute(
+                "SELECT value FROM paraphrase_cache WHERE key = ? AND expires >= ?", (key, time.time())
+            ).fetchone()
+        except sqlite3.Error:
+            return None
+        return row[0] if row else None
+
+    def set(self, key, value):
+        try:
+            connection = self._connection()
+            connection.execute(
+                "INSERT OR REPLACE INTO paraphrase_cache (key, value, expires) VALUES (?, ?, ?)",
+                (key, value, time.time() + self.ttl)
+            )
+            self._writes += 1
+            if self._writes % self.PRUNE_INTERVAL == 0:
+                self._prune(connection)
+        except sqlite3.Error:
+            pass
+
+    def _prune(self, connection):
+        """Drop expired entries, then the soonest-expiring ones beyond max_entries."""
+        connection.execute("DELETE FROM paraphrase_cache WHERE expires < ?", (time.time(),))
+        excess = connection.execute("SELECT COUNT(*) FROM paraphrase_cache").fetchone()[0] - self.max_entries
+        if excess > 0:
+            connection.execute(
+                "DELETE FROM paraphrase_cache WHERE key IN "
+                "(SELECT key FROM paraphrase_cache ORDER BY expires LIMIT ?)", (excess,)
+            )
+
+    def clear(self):
+        try:
+            self._connection().execute("DELETE FROM paraphrase_cache")
+        except sqlite3.Error:
+            pass
+
+
+class ParaphraseCache:
+    """An in-process LRU in front of an optional shared sqlite store."""
+
+    def __init__(self, memory, shared=None):
+        self.memory = memory
+        # A shared store that couldn't be opened is left out
+        self.shared = shared if shared is not None and getattr(shared, 'available', True) else None
+
+    def get(self, key):
+        value = self.memory.get(key)
+        if value is None and self.shared is not None:
+            value = self.shared.get(key)
+            if value is not None:
+                self.memory.set(key, value)
+        return value
+
+    def set(self, key, value):
+        self.memory.set(key, value)
+        if self.shared is not None:
+            self.shared.set(key, value)
+
+    def clear(self):
+        self.memory.clear()
+        if self.shared is not None:
+            self.shared.clear()
+
+
+def default_cache_path():
+    """Location of the shared cache database when none is configured."""
+    return os.path.join(tempfile.gettempdir(), 'paraphraser_cache.sqlite3')
@@ -0,0 +1,80 @@
+"""Routing documents to the domain lexicons they need.
+
+Each domain (legal, medical, IT, ...) has its own lexicon of terms under
+lexicons/domains/, used on top of the general lexicon.  The inverted index
+compiled from them maps every domain term to its domains, so classifying a
+document is one pass of LexiconMatcher over its words: each term found is a
+vote for its domains.  Only the domains with a large enough share of the
+votes are consulted for replacements, so a term shared by two domains gets
+the sense of the one the document is about.  Both passes look up each
+distinct word of the document once, so their cost depends on the length of
+the document and not on the size of the vocabularies.
+
+Domain lexicons hold the domain's terms (nouns and noun phrases), which double
+as the topics restructured sentences are framed around.
+"""
+import hashlib
+import threading
+
+from lexicon import DOMAIN_DIR, LexiconStack, domain_sources_version, load_domain_index, load_domain_lexicon
+from lexicon_matcher import LexiconMatcher
+
+# Smallest share of a document's domain terms a domain needs to be used
+MIN_DOMAIN_SHARE = 0.25
+
+
+class DomainRouter:
+    """Classifies documents by domain and matches them against the lexicons of their domains."""
+
+    def __init__(self, lexicon, directory=DOMAIN_DIR):
+        self.lexicon = lexicon
+        self.directory = directory
+        self.index = load_domain_index(directory)
+        self.index_matcher = LexiconMatcher(self.index)
+        # Domains, in order of precedence -> matcher over their lexicons and the general one
+        self._matchers = {(): LexiconMatcher(lexicon)}
+        self._lock = threading.Lock()
+        self._version = None
+
+    @property
+    def version(self):
+        """Identifies the general lexicon, the index and every domain lexicon, for caching results.
+
+        Domain lexicons are identified by their sources, so this doesn't
+        compile or open the ones no document has needed yet.
+        """
+        if self._version is None:
+            versions = [self.lexicon.version, self.index.version, domain_sources_version(self.directory)]
+            self._version = hashlib.sha256(' '.join(versions).encode()).hexdigest()[:32]
+        return self._version
+
+    def classify(self, text):
+        """Return the domains text is about, the one with the most terms first."""
+        votes = {}
+        lookup = self.index.lookup
+        for term in self.index_matcher.keys(text):
+            for domain in lookup(term)[1]:
+                votes[domain] = votes.get(domain, 0) + 1
+        total = sum(votes.values())
+        return tuple(sorted((domain for domain, count in votes.items() if count >= MIN_DOMAIN_SHARE * total),
+                            key=lambda domain: (-votes[domain], domain)))
+
+    def matcher_for(self, domains):
+        """Return the matcher for a tuple of domains: their lexicons, in order, then the general one."""
+        matcher = self._matchers.get(domains)
+        if matcher is None:
+            with self._lock:
+                matcher = self._matchers.get(domains)
+                if matcher is None:
+                    lexicons = [load_domain_lexicon(domain, self.directory) for domain in domains]
+                    matcher = self._matchers[domains] = LexiconMatcher(LexiconStack(lexicons + [self.lexicon]))
+        return matcher
+
+    def route(self, text):
+        """Return the matcher for the domains text is about."""
+        return self.matcher_for(self.classify(text))
+
+    def topic(self, sentence):
+        """Return the first domain term in sentence, capitalized, or None if it has none."""
+        terms = self.index_matcher.keys(sentence)
+        return terms[0].capitalize() if terms else None
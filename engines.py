@@ -0,0 +1,129 @@
+"""Registry of the paraphrasing engines the service can use.
+
+An engine is a module with the same set of functions (paraphrase_text,
+paraphrase_batch, cache_namespace, and optionally iter_paraphrase,
+paraphrase_variants and warm_up).  The registry imports each module the
+first time its engine is selected, so heavy dependencies such as torch are
+only loaded for the engine that is actually used, and can warm an engine up
+on a background thread so the first request doesn't pay for loading its
+lexicon or model.
+"""
+import importlib
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Engine name -> module implementing it
+ENGINE_MODULES = {
+    'simple': 'simple_paraphraser',
+    'enhanced': 'enhanced_paraphraser',
+    'ml': 'paraphraser_example',
+}
+
+# Engine served instead when an engine's dependencies aren't installed
+FALLBACKS = {
+    'ml': 'enhanced',
+}
+
+# States an engine goes through
+COLD = 'cold'
+WARMING = 'warming'
+READY = 'ready'
+FAILED = 'failed'
+UNAVAILABLE = 'unavailable'  # dependencies missing, requests go to the fallback
+
+
+class EngineRegistry:
+    """Imports engines once, on first use, and tracks whether each one is warm."""
+
+    def __init__(self, modules=None, fallbacks=None):
+        self.modules = dict(ENGINE_MODULES if modules is None else modules)
+        self.fallbacks = dict(FALLBACKS if fallbacks is None else fallbacks)
+        # Engine name -> name of the engine that serves it (itself unless it fell back)
+        self._resolved = {}
+        self._states = {name: COLD for name in self.modules}
+        self._errors = {}
+        self._threads = {}
+        self._lock = threading.RLock()
+
+    def resolve(self, name):
+        """Return the name of the engine serving requests for name, importing it on first use.
+
+        Raises KeyError for an unknown engine, and ImportError if the engine
+        and all its fallbacks are missing dependencies.
+        """
+        resolved = self._resolved.get(name)
+        if resolved is not None:
+            return resolved
+        with self._lock:
+            resolved = self._resolved.get(name)
+            if resolved is None:
+                resolved = self._resolved[name] = self._import(name)
+        return resolved
+
+    def _import(self, name):
+        if name not in self.modules:
+            raise KeyError(f"Unknown engine: {name}")
+        try:
+            module = importlib.import_module(self.modules[name])
+            # Engines with optional dependencies check for them without importing them
+            check_dependencies = getattr(module, 'check_dependencies', None)
+            if check_dependencies is not None:
+                check_dependencies()
+            return name
+        except ImportError as e:
+            fallback = self.fallbacks.get(name)
+            if fallback is None:
+                raise
+            logger.warning(f"Dependencies of the {name} engine not found: {str(e)}. Falling back to the {fallback} engine.")
+            self._states[name] = UNAVAILABLE
+            self._errors[name] = str(e)
+            return self.resolve(fallback)
+
+    def get(self, name):
+        """Return the module serving requests for name."""
+        return importlib.import_module(self.modules[self.resolve(name)])
+
+    def warm_up(self, name, **options):
+        """Start warming up the engine serving name on a background thread, once.
+
+        options are passed to the module's warm_up (e.g. workers for its batch
+        pool).  Returns the thread, which can be joined to wait for the engine
+        to be ready.
+        """
+        with self._lock:
+            thread = self._threads.get(name)
+            if thread is None:
+                thread = self._threads[name] = threading.Thread(
+                    target=self._warm_up, args=(name,), kwargs=options, name=f"warm-up-{name}", daemon=True)
+                thread.start()
+        return thread
+
+    def _warm_up(self, name, **options):
+        try:
+            name = self.resolve(name)
+            self._states[name] = WARMING
+            warm_up = getattr(self.get(name), 'warm_up', None)
+            if warm_up is not None:
+                warm_up(**options)
+            self._states[name] = READY
+            logger.info(f"The {name} engine is ready")
+        except Exception as e:
+            self._states[name] = FAILED
+            self._errors[name] = str(e)
+            logger.exception(f"Warming up the {name} engine failed")
+
+    def is_ready(self, name):
+        """Return whether the engine serving name has finished warming up."""
+        resolved = self._resolved.get(name)
+        return resolved is not None and self._states[resolved] == READY
+
+    def status(self):
+        """Return {engine name: {'state': ..., and 'error' for failed or unavailable engines}}."""
+        status = {}
+        for name, state in self._states.items():
+            status[name] = {'state': state}
+            if state in (FAILED, UNAVAILABLE):
+                status[name]['error'] = self._errors.get(name)
+        return status
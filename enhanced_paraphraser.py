@@ -1,96 +1,69 @@
+import functools
+import itertools
 import random
 import re
+import threading
+import time
+
+import numpy as np
+
+from domains import DomainRouter
+from lexicon import DOMAIN_DIR, load_lexicon
+import metrics
+import parallel
+import scoring
+import sessions
+from transformations import ClauseSequence, TokenSequence
+
+# Segment boundaries: whitespace after a period, question mark or exclamation point
+SEGMENT_BOUNDARY = re.compile(r'(?<=[.!?])\s+')
+# Longest segment held while waiting for a boundary; longer runs are split at whitespace
+MAX_SEGMENT_LENGTH = 65536
+# Characters read at a time when paraphrasing a file
+READ_SIZE = 65536
+# Rounds of sampling paraphrase_variants makes while trying to find n distinct variants
+VARIANT_ROUNDS = 8
+# Text paraphrased by warm_up
+WARM_UP_TEXT = "Cloud computing is important for modern businesses."
+
+class ParaphrasePlan:
+    """The parts of a paraphrase that don't depend on random choices, worked out once per text.
+    
+    Holds the text's segments and, for each segment, the lexicon matches that
+    may be replaced, as (start, end, alternatives) with the alternatives
+    already capitalized to match the original.
+    """
+    
+    def __init__(self, segments, spans):
+        self.segments = segments
+        self.spans = spans
+        # Index of each segment's first match among the matches of the whole text
+        self.offsets = list(itertools.accumulate((len(segment_spans) for segment_spans in spans), initial=0))
+        self.alternative_counts = np.array(
+            [len(alternatives) for segment_spans in spans for _, _, alternatives in segment_spans], dtype=np.intp
+        )
 
 class EnhancedParaphraser:
     """An enhanced rule-based paraphraser that produces more significant changes."""
     
-    def __init__(self):
-        # Word replacements (common words and their alternatives)
-        self.word_replacements = {
-            # Nouns
-            'environment': ['ecosystem', 'setting', 'landscape', 'context'],
-            'resources': ['assets', 'components', 'elements', 'capabilities'],
-            'infrastructure': ['framework', 'foundation', 'structure', 'architecture'],
-            'efficiency': ['effectiveness', 'performance', 'productivity', 'efficacy'],
-            'sustainability': ['durability', 'resilience', 'viability', 'eco-friendliness'],
-            'energy': ['power', 'fuel', 'electricity', 'resource'],
-            'methods': ['approaches', 'techniques', 'procedures', 'strategies'],
-            'machines': ['devices', 'equipment', 'systems', 'hardware'],
-            'models': ['frameworks', 'architectures', 'designs', 'paradigms'],
-            'tools': ['utilities', 'instruments', 'applications', 'solutions'],
-            'decisions': ['choices', 'judgments', 'determinations', 'selections'],
-            'techniques': ['methods', 'approaches', 'practices', 'procedures'],
-            'cloud': ['remote', 'distributed', 'networked', 'virtualized'],
-            'computing': ['processing', 'calculation', 'IT infrastructure', 'information processing'],
-            'intelligence': ['intellect', 'reasoning', 'cognitive systems', 'smart technology'],
-            'heuristics': ['guidelines', 'rules of thumb', 'practical methods', 'strategies'],
-            'workloads': ['tasks', 'operations', 'processes', 'jobs'],
-            'data': ['information', 'content', 'records', 'metrics'],
-            'centers': ['facilities', 'installations', 'hubs', 'complexes'],
-            'research': ['investigation', 'study', 'analysis', 'exploration'],
-            'framework': ['structure', 'system', 'methodology', 'approach'],
-            'aim': ['goal', 'objective', 'purpose', 'target'],
-            'challenges': ['problems', 'difficulties', 'obstacles', 'hurdles'],
-            'allocation': ['distribution', 'assignment', 'provisioning', 'apportionment'],
-            'concerns': ['issues', 'considerations', 'worries', 'apprehensions'],
-            'requirement': ['need', 'necessity', 'prerequisite', 'demand'],
-            'consumption': ['usage', 'utilization', 'expenditure', 'depletion'],
-            
-            # Verbs
-            'affect': ['influence', 'impact', 'modify', 'shape'],
-            'organized': ['arranged', 'structured', 'ordered', 'classified'],
-            'makes': ['creates', 'produces', 'generates', 'forms'],
-            'failed': ['underperformed', 'fallen short', 'been inadequate', 'not succeeded'],
-            'emerged': ['appeared', 'surfaced', 'arisen', 'come forth'],
-            'optimizing': ['improving', 'enhancing', 'refining', 'maximizing'],
-            'allocate': ['assign', 'distribute', 'designate', 'apportion'],
-            'manage': ['handle', 'control', 'administer', 'oversee'],
-            'address': ['tackle', 'resolve', 'handle', 'deal with'],
-            'leads': ['results in', 'causes', 'drives', 'brings about'],
-            'increase': ['growth', 'rise', 'escalation', 'surge'],
-            'doubled': ['increased twofold', 'multiplied by two', 'grown by 100%', 'expanded dramatically'],
-            'needs': ['requires', 'necessitates', 'demands', 'calls for'],
-            'using': ['utilizing', 'employing', 'leveraging', 'applying'],
-            'proposing': ['suggesting', 'recommending', 'presenting', 'putting forward'],
-            
-            # Adjectives
-            'complex': ['complicated', 'intricate', 'sophisticated', 'multifaceted'],
-            'dynamic': ['changing', 'fluid', 'evolving', 'adaptable'],
-            'optimal': ['best', 'ideal', 'superior', 'prime'],
-            'physical': ['tangible', 'material', 'concrete', 'actual'],
-            'virtual': ['digital', 'simulated', 'online', 'cloud-based'],
-            'heterogeneous': ['diverse', 'varied', 'mixed', 'assorted'],
-            'promising': ['potential', 'hopeful', 'encouraging', 'prospective'],
-            'artificial': ['synthetic', 'manufactured', 'simulated', 'machine-based'],
-            'intelligent': ['smart', 'cognitive', 'AI-driven', 'automated'],
-            'sustainable': ['eco-friendly', 'green', 'renewable', 'environmentally sound'],
-            'large': ['substantial', 'significant', 'considerable', 'extensive'],
-            'rising': ['increasing', 'growing', 'escalating', 'mounting'],
-            'environmental': ['ecological', 'green', 'nature-related', 'planet-friendly'],
-            'hybrid': ['combined', 'mixed', 'blended', 'dual'],
-            
-            # Phrases
-            'there are': ['we find', 'one can observe', 'it contains', 'we see'],
-            'significantly affect': ['greatly impact', 'considerably influence', 'substantially change', 'notably alter'],
-            'recently': ['lately', 'in recent times', 'not long ago', 'in the near past'],
-            'based on': ['founded on', 'derived from', 'grounded in', 'rooted in'],
-            'that leads to': ['which results in', 'causing', 'leading to', 'triggering'],
-            'by proposing': ['through the introduction of', 'by presenting', 'with the development of', 'via the creation of'],
-            'will be': ['is projected to be', 'is expected to be', 'is anticipated to be', 'is forecasted to become'],
-            'needs for': ['requires', 'necessitates', 'demands', 'calls for'],
-            'the aim of': ['the objective of', 'the goal of', 'the purpose of', 'the intention behind'],
-        }
-        
-        # Sentence transformations
+    def __init__(self, lexicon=None, domain_dir=DOMAIN_DIR):
+        # Word replacements (common words and phrases and their alternatives),
+        # shared read-only by every instance in the process
+        self.lexicon = lexicon if lexicon is not None else load_lexicon('enhanced')
+        # Domain-specific replacements, used for the domains a text is about
+        self.router = DomainRouter(self.lexicon, domain_dir)
+        
+        # Sentence transformations (each equivalent to re.sub with the pattern
+        # and replacement in its comment, in linear time)
         self.sentence_transformations = [
-            # Passive to active voice
-            (r'is ([\w]+ed) by', r'actively \1'),
-            # Active to passive voice
-            (r'([\w]+) ([\w]+s) the', r'the is \2ed by \1'),
-            # Change sentence structure
-            (r'(.*?) is to (.*?) by (.*?)', r'\3 enables \1 to \2'),
-            # Invert sentence parts around conjunctions
-            (r'(.*?) and (.*?)', r'\2 and \1'),
+            # Passive to active voice: r'is ([\w]+ed) by' -> r'actively \1'
+            TokenSequence((), 'actively {0}', prefix='is ', suffix=' by', last_suffix='ed'),
+            # Active to passive voice: r'([\w]+) ([\w]+s) the' -> r'the is \2ed by \1'
+            TokenSequence((' ',), 'the is {1}ed by {0}', suffix=' the', last_suffix='s'),
+            # Change sentence structure: r'(.*?) is to (.*?) by (.*?)' -> r'\3 enables \1 to \2'
+            ClauseSequence((' is to ', ' by '), ' enables {0} to {1}'),
+            # Invert sentence parts around conjunctions: r'(.*?) and (.*?)' -> r'\2 and \1'
+            ClauseSequence((' and ',), ' and {0}'),
         ]
         
         # Sentence starters to completely restructure sentences
@@ -107,118 +80,393 @@ class EnhancedParaphraser:
             "It is notable that in {topic}, {rest}",
         ]
         
+        # Transition words added between segments
+        self.transition_words = ['Furthermore', 'Additionally', 'Moreover', 'In addition', 'Besides', 
+                                 'Similarly', 'Likewise', 'Consequently', 'As a result', 'Therefore',
+                                 'However', 'Nevertheless', 'On the other hand', 'In contrast', 'Conversely']
+        
     def extract_topic(self, sentence):
-        """Extract the likely topic of a sentence."""
-        words = sentence.lower().split()
-        for word in ['cloud', 'data', 'resource', 'energy', 'computing', 'sustainability']:
-            if word in words:
-                return word.capitalize()
-        return "This context"
+        """Extract the likely topic of a sentence: its first domain term."""
+        return self.router.topic(sentence) or "This context"
     
     def get_segments(self, text):
         """Break text into logical segments for major restructuring."""
-        # Split by periods, question marks, and exclamation points
-        segments = re.split(r'(?<=[.!?])\s+', text)
-        return [s for s in segments if s.strip()]
+        return list(self.iter_segments(text))
+    
+    def iter_segments(self, text_or_file):
+        """Yield segments from a string, or from a text file read a block at a time."""
+        return self._segment_blocks(self._blocks(text_or_file))
+    
+    def _blocks(self, text_or_file):
+        """Return an iterator over a string, as one block, or over a text file a block at a time."""
+        if isinstance(text_or_file, str):
+            return iter((text_or_file,))
+        return iter(functools.partial(text_or_file.read, READ_SIZE), '')
+    
+    def _segment_blocks(self, blocks):
+        """Yield segments from blocks of text."""
+        carry = ''
+        for block in itertools.chain(blocks, (None,)):
+            final = block is None
+            buffer = carry if final else carry + block
+            start = 0
+            # Split by periods, question marks, and exclamation points
+            for match in SEGMENT_BOUNDARY.finditer(buffer):
+                # Whitespace at the end of a block may continue in the next one
+                if match.end() == len(buffer) and not final:
+                    break
+                yield from self._split_long_segment(buffer[start:match.start()])
+                start = match.end()
+            carry = buffer[start:]
+            
+            if final:
+                yield from self._split_long_segment(carry)
+            elif len(carry) > MAX_SEGMENT_LENGTH:
+                # No sentence boundary in sight; emit what is safe and keep the tail
+                *pieces, carry = self._split_long_segment(carry, keep_tail=True)
+                yield from pieces
+    
+    def _split_long_segment(self, segment, keep_tail=False):
+        """Split a segment longer than MAX_SEGMENT_LENGTH at whitespace."""
+        start = 0
+        while len(segment) - start > MAX_SEGMENT_LENGTH:
+            cut = segment.rfind(' ', start + 1, start + MAX_SEGMENT_LENGTH)
+            if cut < 0:
+                cut = start + MAX_SEGMENT_LENGTH
+            if segment[start:cut].strip():
+                yield segment[start:cut]
+            start = cut + 1 if segment[cut] == ' ' else cut
+        tail = segment[start:]
+        if keep_tail or tail.strip():
+            yield tail
+        
+    def choose_replacement(self, key, original, rng=random, lexicon=None):
+        """Pick a replacement for a lexicon match, or None to keep the original."""
+        if rng.random() >= 0.5:
+            return None
+        replacement = rng.choice((self.lexicon if lexicon is None else lexicon)[key])
+        # Preserve capitalization
+        if original[0].isupper():
+            replacement = replacement.capitalize()
+        return replacement
         
-    def paraphrase_segment(self, segment):
-        """Apply transformations to a single segment (sentence or clause)."""
+    def paraphrase_segment(self, segment, rng=random, timer=metrics.NULL_STAGE_TIMER, matcher=None):
+        """Apply transformations to a single segment (sentence or clause).
+        
+        matcher is the one for the document's domains; by default the segment's
+        own domains are used.
+        """
         # Skip empty segments
         if not segment.strip():
             return segment
+        if matcher is None:
+            start = time.perf_counter()
+            matcher = self.router.route(segment)
+            timer.add('routing', start)
             
-        # 1. Word replacements (50% chance for each eligible word)
-        words = segment.split()
-        for i in range(len(words)):
-            word_lower = words[i].lower().strip('.,;:!?()"\'')
-            
-            # Check if this word has replacements and we decide to replace it
-            if word_lower in self.word_replacements and random.random() < 0.5:
-                # Choose a replacement
-                replacement = random.choice(self.word_replacements[word_lower])
-                
-                # Preserve capitalization
-                if words[i][0].isupper():
-                    replacement = replacement.capitalize()
-                
-                # Preserve punctuation
-                for char in ',.:;!?()"\'-':
-                    if words[i].endswith(char):
-                        replacement += char
-                        break
-                
-                words[i] = replacement
-        
-        # Reconstruct the segment with word replacements
-        new_segment = ' '.join(words)
+        # 1. Word replacements (50% chance for each eligible word or phrase)
+        start = time.perf_counter()
+        new_segment = matcher.replace(segment, functools.partial(self.choose_replacement, rng=rng, lexicon=matcher.lexicon))
+        timer.add('word_replacement', start)
         
         # 2. Apply sentence transformations (30% chance)
-        if random.random() < 0.3:
+        start = time.perf_counter()
+        if rng.random() < 0.3:
             # Pick a random transformation
-            transformation = random.choice(self.sentence_transformations)
-            try:
-                new_segment = re.sub(transformation[0], transformation[1], new_segment)
-            except:
-                # If transformation fails, keep the original
-                pass
+            new_segment = rng.choice(self.sentence_transformations).apply(new_segment)
+        timer.add('sentence_transformations', start)
                 
         # 3. Major restructuring (20% chance)
-        if random.random() < 0.2:
-            topic = self.extract_topic(new_segment)
-            starter = random.choice(self.sentence_starters)
-            # Remove the period if it exists at the end
-            rest = new_segment.rstrip('.!?')
-            # Make first letter lowercase for the "rest" part
-            if rest:
-                rest = rest[0].lower() + rest[1:]
-            try:
-                new_segment = starter.format(topic=topic, rest=rest) + "."
-            except:
-                # If formatting fails, keep the original
-                pass
+        start = time.perf_counter()
+        if rng.random() < 0.2:
+            new_segment = self.restructure(new_segment, rng.choice(self.sentence_starters))
+        timer.add('starters', start)
         
         return new_segment
+    
+    def restructure(self, segment, starter):
+        """Rebuild a segment around one of the sentence starters."""
+        topic = self.extract_topic(segment)
+        # Remove the period if it exists at the end
+        rest = segment.rstrip('.!?')
+        # Make first letter lowercase for the "rest" part
+        if rest:
+            rest = rest[0].lower() + rest[1:]
+        try:
+            return starter.format(topic=topic, rest=rest) + "."
+        except:
+            # If formatting fails, keep the original
+            return segment
         
-    def paraphrase(self, text):
-        """Thoroughly paraphrase the given text."""
-        # Get segments (sentences)
-        segments = self.get_segments(text)
+    def iter_paraphrase(self, text_or_file, seed=None):
+        """Yield paraphrased segments one at a time from a string or text file.
         
-        # Process each segment
-        paraphrased_segments = [self.paraphrase_segment(segment) for segment in segments]
-        
-        # 4. Potentially reorder some segments (10% chance)
-        if len(segments) > 1 and random.random() < 0.1:
-            # Find segments that could be swapped without losing coherence
-            idx1 = random.randint(0, len(paraphrased_segments) - 1)
-            idx2 = random.randint(0, len(paraphrased_segments) - 1)
-            if idx1 != idx2:
-                paraphrased_segments[idx1], paraphrased_segments[idx2] = paraphrased_segments[idx2], paraphrased_segments[idx1]
-        
-        # 5. Add transition words between segments (40% chance if multiple segments)
-        if len(segments) > 1:
-            transition_words = ['Furthermore', 'Additionally', 'Moreover', 'In addition', 'Besides', 
-                               'Similarly', 'Likewise', 'Consequently', 'As a result', 'Therefore',
-                               'However', 'Nevertheless', 'On the other hand', 'In contrast', 'Conversely']
-            
-            for i in range(1, len(paraphrased_segments)):
-                if random.random() < 0.4:
-                    transition = random.choice(transition_words)
-                    # Remove period from previous segment if it exists
-                    if paraphrased_segments[i-1].endswith('.'):
-                        paraphrased_segments[i-1] = paraphrased_segments[i-1][:-1] + ','
-                    # Add transition to the beginning of this segment
-                    paraphrased_segments[i] = f"{transition.lower()} {paraphrased_segments[i]}"
+        Segments are produced as soon as they are ready, holding at most a
+        couple of them at once, so memory stays flat for any document size.
+        The document's domains are picked from the whole of a string, and from
+        the first block of a file.  With a seed, the same text always gives the
+        same paraphrase.
+        """
+        rng = random.Random(seed) if seed is not None else random
+        # Stage times are added up over the whole text and recorded at the end
+        timer = metrics.stage_timer('enhanced')
+        
+        blocks = self._blocks(text_or_file)
+        first = next(blocks, '')
+        start = time.perf_counter()
+        matcher = self.router.route(first)
+        timer.add('routing', start)
+        
+        # Process each segment (sentence) as it is read
+        segments = self._timed(self._segment_blocks(itertools.chain((first,), blocks)), timer, 'segmentation')
+        segments = (self.paraphrase_segment(segment, rng, timer, matcher) for segment in segments)
+        segments = self._reorder_segments(segments, rng, timer)
+        try:
+            yield from self._add_transitions(segments, rng, timer)
+        finally:
+            timer.observe()
         
+    def _timed(self, segments, timer, stage):
+        """Yield from segments, adding the time spent producing each one to stage."""
+        segments = iter(segments)
+        while True:
+            start = time.perf_counter()
+            segment = next(segments, None)
+            timer.add(stage, start)
+            if segment is None:
+                return
+            yield segment
+        
+    def _reorder_segments(self, segments, rng, timer=metrics.NULL_STAGE_TIMER):
+        """Swap neighbouring segments now and then, looking one segment ahead."""
+        pending = None
+        for segment in segments:
+            if pending is None:
+                pending = segment
+                continue
+            # 4. Potentially swap a segment with the next one (5% chance per pair)
+            start = time.perf_counter()
+            swap = rng.random() < 0.05
+            timer.add('reordering', start)
+            if swap:
+                yield segment
+                yield pending
+                pending = None
+            else:
+                yield pending
+                pending = segment
+        if pending is not None:
+            yield pending
+        
+    def _add_transitions(self, segments, rng, timer=metrics.NULL_STAGE_TIMER):
+        """Add transition words between segments, looking one segment ahead."""
+        previous = None
+        for segment in segments:
+            # 5. Add transition words between segments (40% chance)
+            start = time.perf_counter()
+            if previous is not None and rng.random() < 0.4:
+                transition = rng.choice(self.transition_words)
+                # Remove period from previous segment if it exists
+                if previous.endswith('.'):
+                    previous = previous[:-1] + ','
+                # Add transition to the beginning of this segment
+                segment = f"{transition.lower()} {segment}"
+            timer.add('transitions', start)
+            if previous is not None:
+                yield previous
+            previous = segment
+        if previous is not None:
+            yield previous
+        
+    def paraphrase(self, text, seed=None):
+        """Thoroughly paraphrase the given text.
+        
+        With a seed, the same text always gives the same paraphrase.
+        """
         # Join segments back together
-        paraphrased_text = ' '.join(paraphrased_segments)
+        return ' '.join(self.iter_paraphrase(text, seed))
+
+    def paraphrase_batch(self, texts, workers=None, seed=None, candidates=1):
+        """Paraphrase many texts across a pool of worker processes, keeping input order.
+        
+        With candidates > 1, each text gets the best of that many paraphrases, as from paraphrase_ranked.
+        """
+        return parallel.paraphrase_batch(self, texts, workers, seed, candidates)
+    
+    def analyze(self, text):
+        """Segment text and find its lexicon matches once, for rendering many variants."""
+        segments = self.get_segments(text)
+        matcher = self.router.route(text)
+        spans = []
+        for segment in segments:
+            segment_spans = []
+            for start, end, key in matcher.finditer(segment):
+                alternatives = matcher.lexicon[key]
+                # Preserve capitalization
+                if segment[start].isupper():
+                    alternatives = tuple(alternative.capitalize() for alternative in alternatives)
+                segment_spans.append((start, end, alternatives))
+            spans.append(segment_spans)
+        return ParaphrasePlan(segments, spans)
+    
+    def paraphrase_variants(self, text, n, seed=None):
+        """Return n distinct paraphrases of text.
+        
+        The text is analyzed once and every variant is rendered from the same
+        plan, with the random choices for all of them drawn together, so this
+        is much cheaper than n calls to paraphrase.  Fewer than n variants are
+        returned if the text doesn't have that many distinct paraphrases.  With
+        a seed, the same text always gives the same variants.
+        """
+        timer = metrics.stage_timer('enhanced')
+        start = time.perf_counter()
+        plan = self.analyze(text)
+        timer.add('analysis', start)
+        
+        start = time.perf_counter()
+        rng = np.random.default_rng(seed)
+        # A dict keeps the first occurrence of each variant, in order
+        variants = {}
+        for _ in range(VARIANT_ROUNDS):
+            missing = n - len(variants)
+            if missing <= 0:
+                break
+            variants.update(dict.fromkeys(self._sample_variants(plan, missing, rng)))
+        timer.add('rendering', start)
+        timer.observe()
+        return list(variants)[:n]
+    
+    def paraphrase_ranked(self, text, n, candidates, seed=None):
+        """Return the n best of up to candidates distinct paraphrases of text, best first.
+        
+        Every variant is scored against text in one pass (see scoring.py), so
+        variants where a rule misfired sort last.
+        """
+        variants = self.paraphrase_variants(text, max(n, candidates), seed)
+        timer = metrics.stage_timer('enhanced')
+        start = time.perf_counter()
+        ranked = scoring.rank(text, variants)[:n]
+        timer.add('scoring', start)
+        timer.observe()
+        return ranked
+    
+    def _sample_variants(self, plan, n, rng):
+        """Render n variants from plan, drawing every random choice up front."""
+        shape = (n, len(plan.segments))
+        # Each choice is an index into the options, or -1 where the step doesn't happen
+        choices = np.where(
+            rng.random((n, len(plan.alternative_counts))) < 0.5,
+            (rng.random((n, len(plan.alternative_counts))) * plan.alternative_counts).astype(np.intp),
+            -1
+        )
+        transformations = np.where(rng.random(shape) < 0.3, rng.integers(len(self.sentence_transformations), size=shape), -1)
+        starters = np.where(rng.random(shape) < 0.2, rng.integers(len(self.sentence_starters), size=shape), -1)
+        swaps = rng.random(shape) < 0.05
+        transitions = np.where(rng.random(shape) < 0.4, rng.integers(len(self.transition_words), size=shape), -1)
         
-        return paraphrased_text
+        for row in zip(choices.tolist(), transformations.tolist(), starters.tolist(), swaps.tolist(), transitions.tolist()):
+            yield self._render_variant(plan, *row)
+    
+    def _render_variant(self, plan, choices, transformations, starters, swaps, transitions):
+        """Render one variant of a plan from its drawn choices."""
+        rendered = []
+        for k, segment in enumerate(plan.segments):
+            # 1. Word replacements
+            pieces = []
+            last = 0
+            for choice, (start, end, alternatives) in zip(choices[plan.offsets[k]:plan.offsets[k + 1]], plan.spans[k]):
+                if choice >= 0:
+                    pieces.append(segment[last:start])
+                    pieces.append(alternatives[choice])
+                    last = end
+            if pieces:
+                pieces.append(segment[last:])
+                segment = ''.join(pieces)
+            # 2. Sentence transformations
+            if transformations[k] >= 0:
+                segment = self.sentence_transformations[transformations[k]].apply(segment)
+            # 3. Major restructuring
+            if starters[k] >= 0:
+                segment = self.restructure(segment, self.sentence_starters[starters[k]])
+            rendered.append(segment)
+        
+        # 4. Swap neighbouring segments
+        ordered = []
+        pending = None
+        for k, segment in enumerate(rendered):
+            if pending is None:
+                pending = segment
+            elif swaps[k]:
+                ordered.append(segment)
+                ordered.append(pending)
+                pending = None
+            else:
+                ordered.append(pending)
+                pending = segment
+        if pending is not None:
+            ordered.append(pending)
+        
+        # 5. Transition words between segments
+        for k in range(1, len(ordered)):
+            if transitions[k] >= 0:
+                if ordered[k - 1].endswith('.'):
+                    ordered[k - 1] = ordered[k - 1][:-1] + ','
+                ordered[k] = f"{self.transition_words[transitions[k]].lower()} {ordered[k]}"
+        return ' '.join(ordered)
+
+_paraphraser = None
+_paraphraser_lock = threading.Lock()
+
+def get_paraphraser():
+    """Return the process-wide EnhancedParaphraser, creating it on first use."""
+    global _paraphraser
+    if _paraphraser is None:
+        with _paraphraser_lock:
+            if _paraphraser is None:
+                _paraphraser = EnhancedParaphraser()
+    return _paraphraser
+
+def warm_up(workers=None, start_pool=False):
+    """Function to load the shared instance and its lexicon ahead of the first request.
+
+    With start_pool, the pool of workers batch processes is started too, rather than on the first batch.
+    """
+    get_paraphraser().paraphrase(WARM_UP_TEXT, 0)
+    if start_pool:
+        parallel.warm_pool(get_paraphraser(), workers)
 
-def paraphrase_text(text):
+def paraphrase_text(text, seed=None):
     """Function to interface with the enhanced paraphraser class."""
-    paraphraser = EnhancedParaphraser()
-    return paraphraser.paraphrase(text)
+    return get_paraphraser().paraphrase(text, seed)
+
+def iter_paraphrase(text_or_file, seed=None):
+    """Function to stream paraphrased segments from the shared instance."""
+    return get_paraphraser().iter_paraphrase(text_or_file, seed)
+
+def paraphrase_batch(texts, workers=None, seed=None, candidates=1):
+    """Function to paraphrase many texts in parallel with the shared instance."""
+    return get_paraphraser().paraphrase_batch(texts, workers, seed, candidates)
+
+def paraphrase_variants(text, n, seed=None):
+    """Function to produce several distinct paraphrases with the shared instance."""
+    return get_paraphraser().paraphrase_variants(text, n, seed)
+
+def paraphrase_ranked(text, n, candidates, seed=None):
+    """Function to produce the best of many candidate paraphrases with the shared instance."""
+    return get_paraphraser().paraphrase_ranked(text, n, candidates, seed)
+
+def create_session(seed=None, max_length=None):
+    """Function to start an incremental editing session with the shared instance."""
+    return sessions.EditingSession(get_paraphraser(), seed, max_length)
+
+def cache_namespace(seed=None):
+    """Return the namespace for caching results, or None if they can't be cached.
+    
+    Unseeded results are random on every call, so only seeded ones are cached.
+    """
+    if seed is None:
+        return None
+    return f"enhanced:{get_paraphraser().router.version}"
 
 # Example usage
 if __name__ == "__main__":
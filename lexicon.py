@@ -0,0 +1,444 @@
+"""Compiled, memory-mapped thesaurus storage for the rule-based paraphrasers.
+
+Lexicons are written as JSON ({"word": ["alt", ...]}) or TSV (word, tab,
+alternatives separated by tabs) under lexicons/ and compiled into a compact
+binary ``.lex`` file.  The compiled file is an open-addressing hash table that
+is memory-mapped and queried in place, so loading it costs the same whether it
+holds a hundred entries or a million, and forked workers share the same pages.
+
+Vocabulary specific to one domain (legal, medical, IT, ...) lives in its own
+lexicon under lexicons/domains/, and an inverted index from every domain term
+to the domains that define it is compiled next to it, as lexicons/domains.lex.
+A document only consults the domains it is about (see domains.py).
+
+Compile every source in lexicons/ and lexicons/domains/, and the index, with:
+
+    python lexicon.py build
+
+Compiled files are written next to their sources, or under the directory in
+the PARAPHRASER_LEXICON_BUILD_DIR environment variable (mirroring lexicons/),
+for deployments where the sources are read-only.
+"""
+import argparse
+import hashlib
+import json
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import zlib
+from collections.abc import Mapping
+
+LEXICON_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'lexicons')
+DOMAIN_DIR = os.path.join(LEXICON_DIR, 'domains')
+# Where lexicons under LEXICON_DIR are compiled to, if not next to their sources
+BUILD_DIR = os.environ.get('PARAPHRASER_LEXICON_BUILD_DIR')
+SOURCE_EXTENSIONS = ('.json', '.tsv')
+
+MAGIC = b'PLEX'
+FORMAT_VERSION = 1
+# magic, format version, entries, terminal entries, hash slots, digest
+_HEADER = struct.Struct('<4sIIII16s')
+_SLOT = struct.Struct('<I')
+# key offset, key length, value length, flags; the value follows the key
+_ENTRY = struct.Struct('<IHIB')
+
+# Entry flags: the key is a lexicon entry, and/or the key is the first words
+# of a longer phrase entry
+TERMINAL = 1
+PREFIX = 2
+
+_VALUE_SEPARATOR = '\x1f'
+
+# Upper bound on each lexicon's lookup cache before it is reset.  Most
+# entries are words with no record, so this stays a few MB per lexicon.
+_CACHE_LIMIT = 1 << 14
+
+
+def compiled_path(path):
+    """Return where the compiled file for path (a source, or a .lex path next to the sources) lives."""
+    path = os.path.splitext(path)[0] + '.lex'
+    if BUILD_DIR:
+        relative = os.path.relpath(os.path.abspath(path), LEXICON_DIR)
+        if not relative.startswith(os.pardir):
+            return os.path.join(BUILD_DIR, relative)
+    return path
+
+
+def normalize_key(key):
+    """Lowercase a key and collapse the whitespace between its words."""
+    return ' '.join(key.lower().split())
+
+
+def read_source(path):
+    """Read a JSON or TSV lexicon source into a {key: [alternatives]} dict."""
+    with open(path, encoding='utf-8') as f:
+        if path.endswith('.json'):
+            raw = json.load(f)
+        else:
+            raw = {}
+            for line in f:
+                fields = [field.strip() for field in line.rstrip('\n').split('\t')]
+                if not fields[0] or fields[0].startswith('#'):
+                    continue
+                raw.setdefault(fields[0], []).extend(field for field in fields[1:] if field)
+
+    entries = {}
+    for key, alternatives in raw.items():
+        if not alternatives:
+            continue
+        entries.setdefault(normalize_key(key), []).extend(alternatives)
+    return entries
+
+
+def compile_lexicon(source_path, output_path=None):
+    """Compile a JSON/TSV source into a .lex file and return the output path."""
+    if output_path is None:
+        output_path = compiled_path(source_path)
+    return write_lexicon(read_source(source_path), output_path)
+
+
+def write_lexicon(entries, output_path):
+    """Compile a {normalized key: [alternatives]} dict into a .lex file and return its path."""
+    # Every proper word prefix of a phrase gets a PREFIX entry so the matcher
+    # knows when to keep reading words
+    flags = {key: TERMINAL for key in entries}
+    for key in entries:
+        words = key.split()
+        for i in range(1, len(words)):
+            prefix = ' '.join(words[:i])
+            flags[prefix] = flags.get(prefix, 0) | PREFIX
+
+    keys = sorted(flags)
+    digest = hashlib.sha256()
+    blob = bytearray()
+    records = []
+    for key in keys:
+        encoded_key = key.encode('utf-8')
+        encoded_value = _VALUE_SEPARATOR.join(entries.get(key, ())).encode('utf-8')
+        digest.update(encoded_key + b'\0' + encoded_value + b'\0')
+        records.append((len(blob), len(encoded_key), len(encoded_value), flags[key]))
+        blob += encoded_key
+        blob += encoded_value
+
+    # Keep the table at most three quarters full so probe chains stay short
+    slot_count = 8
+    while 3 * slot_count < 4 * len(keys):
+        slot_count *= 2
+    slots = [0] * slot_count
+    for index, key in enumerate(keys):
+        slot = zlib.crc32(key.encode('utf-8')) & (slot_count - 1)
+        while slots[slot]:
+            slot = (slot + 1) & (slot_count - 1)
+        slots[slot] = index + 1
+
+    # Write to a temporary file first so concurrent readers never see a
+    # partially written lexicon
+    directory = os.path.dirname(os.path.abspath(output_path))
+    os.makedirs(directory, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(_HEADER.pack(MAGIC, FORMAT_VERSION, len(keys), len(entries), slot_count, digest.digest()[:16]))
+            f.write(struct.pack(f'<{slot_count}I', *slots))
+            for record in records:
+                f.write(_ENTRY.pack(*record))
+            f.write(blob)
+        os.chmod(temp_path, 0o644)
+        os.replace(temp_path, output_path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+    return output_path
+
+
+class Lexicon(Mapping):
+    """A read-only, memory-mapped view of a compiled lexicon.
+
+    Behaves like a {key: (alternatives, ...)} mapping.  Lookups go straight to
+    the mapped file and are memoized per process, so only the entries a
+    document actually uses are ever decoded.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self._data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, self._entry_count, self._terminal_count, self._slot_count, digest = \
+            _HEADER.unpack_from(self._data, 0)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            raise ValueError(f"{path} is not a compiled lexicon (format {FORMAT_VERSION})")
+        self.version = digest.hex()
+
+        self._slots_offset = _HEADER.size
+        self._entries_offset = self._slots_offset + self._slot_count * _SLOT.size
+        self._blob_offset = self._entries_offset + self._entry_count * _ENTRY.size
+
+        # key -> (flags, alternatives); absent keys are cached as (0, None)
+        self._cache = {}
+
+    def _find(self, key):
+        """Return the (flags, alternatives) record for key, reading the file."""
+        data = self._data
+        encoded = key.encode('utf-8')
+        mask = self._slot_count - 1
+        slot = zlib.crc32(encoded) & mask
+        while True:
+            index = _SLOT.unpack_from(data, self._slots_offset + slot * _SLOT.size)[0]
+            if not index:
+                return 0, None
+            key_offset, key_length, value_length, flags = \
+                _ENTRY.unpack_from(data, self._entries_offset + (index - 1) * _ENTRY.size)
+            start = self._blob_offset + key_offset
+            if data[start:start + key_length] == encoded:
+                if not flags & TERMINAL:
+                    return flags, None
+                start += key_length
+                value = data[start:start + value_length].decode('utf-8')
+                return flags, tuple(value.split(_VALUE_SEPARATOR))
+            slot = (slot + 1) & mask
+
+    def lookup(self, key):
+        """Return (flags, alternatives) for an already-normalized key."""
+        record = self._cache.get(key)
+        if record is None:
+            if len(self._cache) >= _CACHE_LIMIT:
+                # Swap in a fresh dict rather than clearing, so callers holding
+                # the old one from records() are unaffected
+                self._cache = {}
+            record = self._cache[key] = self._find(key)
+        return record
+
+    def records(self, keys):
+        """Return a dict holding the (flags, alternatives) record of every key."""
+        cache = self._cache
+        missing = set(keys).difference(cache)
+        if missing:
+            if len(cache) + len(missing) > _CACHE_LIMIT:
+                cache = self._cache = {}
+                missing = set(keys)
+            for key in missing:
+                cache[key] = self._find(key)
+        return cache
+
+    def __getitem__(self, key):
+        record = self._cache.get(key)
+        alternatives = record[1] if record is not None else self.lookup(normalize_key(key))[1]
+        if alternatives is None:
+            raise KeyError(key)
+        return alternatives
+
+    def __contains__(self, key):
+        return isinstance(key, str) and self.lookup(normalize_key(key))[1] is not None
+
+    def __len__(self):
+        return self._terminal_count
+
+    def __iter__(self):
+        data = self._data
+        for index in range(self._entry_count):
+            key_offset, key_length, _, flags = \
+                _ENTRY.unpack_from(data, self._entries_offset + index * _ENTRY.size)
+            if flags & TERMINAL:
+                start = self._blob_offset + key_offset
+                yield data[start:start + key_length].decode('utf-8')
+
+    def __repr__(self):
+        return f"<Lexicon {self.path!r} entries={len(self)} version={self.version}>"
+
+
+class LexiconStack(Mapping):
+    """A read-only view of several lexicons, as one.
+
+    A key's alternatives come from the first lexicon that has it, and it is a
+    phrase prefix if it is one in any of them, so a phrase in one lexicon can
+    start with a word of another.  Lookups are memoized like Lexicon's.
+    """
+
+    def __init__(self, lexicons):
+        self.lexicons = tuple(lexicons)
+        self.version = hashlib.sha256(' '.join(lexicon.version for lexicon in self.lexicons).encode()).hexdigest()[:32]
+        self._cache = {}
+
+    def _find(self, key):
+        flags = 0
+        alternatives = None
+        for lexicon in self.lexicons:
+            lexicon_flags, lexicon_alternatives = lexicon.lookup(key)
+            flags |= lexicon_flags
+            if alternatives is None:
+                alternatives = lexicon_alternatives
+        return flags, alternatives
+
+    def lookup(self, key):
+        """Return (flags, alternatives) for an already-normalized key."""
+        record = self._cache.get(key)
+        if record is None:
+            if len(self._cache) >= _CACHE_LIMIT:
+                self._cache = {}
+            record = self._cache[key] = self._find(key)
+        return record
+
+    def records(self, keys):
+        """Return a dict holding the (flags, alternatives) record of every key."""
+        cache = self._cache
+        missing = set(keys).difference(cache)
+        if missing:
+            if len(cache) + len(missing) > _CACHE_LIMIT:
+                cache = self._cache = {}
+                missing = set(keys)
+            for key in missing:
+                cache[key] = self._find(key)
+        return cache
+
+    def __getitem__(self, key):
+        record = self._cache.get(key)
+        alternatives = record[1] if record is not None else self.lookup(normalize_key(key))[1]
+        if alternatives is None:
+            raise KeyError(key)
+        return alternatives
+
+    def __contains__(self, key):
+        return isinstance(key, str) and self.lookup(normalize_key(key))[1] is not None
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __iter__(self):
+        seen = set()
+        for lexicon in self.lexicons:
+            for key in lexicon:
+                if key not in seen:
+                    seen.add(key)
+                    yield key
+
+    def __repr__(self):
+        return f"<LexiconStack {list(self.lexicons)!r}>"
+
+
+_lexicons = {}
+_lexicons_lock = threading.Lock()
+
+
+def _source_for(name, directory=LEXICON_DIR):
+    for extension in SOURCE_EXTENSIONS:
+        path = os.path.join(directory, name + extension)
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def _open(path, sources, build):
+    """Return the shared Lexicon for path, calling build() first if it is missing or older than any of sources."""
+    lexicon = _lexicons.get(path)
+    if lexicon is not None:
+        return lexicon
+
+    with _lexicons_lock:
+        lexicon = _lexicons.get(path)
+        if lexicon is None:
+            if sources and (not os.path.exists(path) or
+                            os.path.getmtime(path) < max(os.path.getmtime(source) for source in sources)):
+                try:
+                    build()
+                except OSError as e:
+                    raise OSError(
+                        f"Can't compile {path} ({str(e)}).  Run 'python lexicon.py build' when deploying, "
+                        f"or set PARAPHRASER_LEXICON_BUILD_DIR to a writable directory."
+                    ) from e
+            lexicon = _lexicons[path] = Lexicon(path)
+    return lexicon
+
+
+def load_lexicon(name, directory=LEXICON_DIR):
+    """Return the shared Lexicon for a name in directory (lexicons/) or a path to a .lex file.
+
+    Each lexicon is opened once per process.  A named lexicon is (re)compiled
+    from its source first if the .lex file is missing or older than the source.
+    """
+    if os.sep in name or name.endswith('.lex'):
+        return _open(name, (), None)
+    path = compiled_path(os.path.join(directory, name))
+    lexicon = _lexicons.get(path)
+    if lexicon is not None:
+        return lexicon
+    source = _source_for(name, directory)
+    if source is None and not os.path.exists(path):
+        raise FileNotFoundError(f"No lexicon source named {name!r} in {directory}")
+    return _open(path, (source,) if source else (), lambda: compile_lexicon(source, path))
+
+
+def domain_sources(directory=DOMAIN_DIR):
+    """Return {domain: source path} for every domain lexicon source in directory."""
+    if not os.path.isdir(directory):
+        return {}
+    return {os.path.splitext(name)[0]: os.path.join(directory, name) for name in sorted(os.listdir(directory))
+            if name.endswith(SOURCE_EXTENSIONS)}
+
+
+def domain_sources_version(directory=DOMAIN_DIR):
+    """Return a version identifying the content of every domain lexicon source in directory.
+
+    Only the sources are read, so no domain lexicon is compiled or opened.
+    """
+    digest = hashlib.sha256()
+    for domain, source in domain_sources(directory).items():
+        with open(source, 'rb') as f:
+            digest.update(domain.encode('utf-8') + b'\0' + hashlib.sha256(f.read()).digest())
+    return digest.hexdigest()[:32]
+
+
+def load_domain_lexicon(domain, directory=DOMAIN_DIR):
+    """Return the shared Lexicon of one domain."""
+    return load_lexicon(domain, directory)
+
+
+def compile_domain_index(directory=DOMAIN_DIR, output_path=None):
+    """Compile the inverted index of the domain lexicons in directory and return its path.
+
+    The index is a lexicon mapping every key of every domain lexicon to the
+    domains that define it, written next to the directory (lexicons/domains.lex)
+    or in the build directory.
+    """
+    index = {}
+    for domain, source in domain_sources(directory).items():
+        for key in read_source(source):
+            index.setdefault(key, []).append(domain)
+    return write_lexicon(index, output_path or compiled_path(directory.rstrip(os.sep)))
+
+
+def load_domain_index(directory=DOMAIN_DIR):
+    """Return the shared inverted index of the domain lexicons in directory, compiling it if it is out of date."""
+    path = compiled_path(directory.rstrip(os.sep))
+    # Adding or removing a domain changes the directory's modification time
+    sources = list(domain_sources(directory).values()) + ([directory] if os.path.isdir(directory) else [])
+    return _open(path, sources, lambda: compile_domain_index(directory, path))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compile paraphraser lexicons.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    compile_parser = subparsers.add_parser('compile', help="compile one JSON/TSV source")
+    compile_parser.add_argument('source')
+    compile_parser.add_argument('output', nargs='?')
+    subparsers.add_parser('build', help="compile every source in lexicons/ and lexicons/domains/, and the domain index")
+    args = parser.parse_args()
+
+    if args.command == 'compile':
+        sources = [(args.source, args.output)]
+    else:
+        sources = [(os.path.join(LEXICON_DIR, name), None) for name in sorted(os.listdir(LEXICON_DIR))
+                   if name.endswith(SOURCE_EXTENSIONS)]
+        sources += [(source, None) for source in domain_sources().values()]
+    for source, output in sources:
+        lexicon = Lexicon(compile_lexicon(source, output))
+        print(f"Compiled {source} -> {lexicon.path} ({len(lexicon)} entries, version {lexicon.version})")
+    if args.command == 'build' and domain_sources():
+        index = Lexicon(compile_domain_index())
+        print(f"Compiled the domain index -> {index.path} ({len(index)} terms, version {index.version})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+import re
+import string
+
+from lexicon import PREFIX, TERMINAL
+
+# Punctuation that separates words.  Hyphens and underscores are kept inside
+# words so that "cloud-based" is never rewritten piecemeal.
+SEPARATORS = frozenset(c for c in string.punctuation if c not in '-_') | frozenset('‘’“”–—…«»')
+_SEPARATOR_TABLE = str.maketrans({c: ' ' for c in SEPARATORS})
+# A word: a run of characters that are neither whitespace nor separators
+_WORD = re.compile(r'[^\s' + re.escape(''.join(sorted(SEPARATORS))) + ']+')
+
+
+def _lower_aligned(text):
+    """Lowercase text without changing its length, so offsets stay valid."""
+    lowered = text.lower()
+    if len(lowered) == len(text):
+        return lowered
+    # A few characters (e.g. 'İ') expand when lowercased; leave those alone
+    return ''.join(c if len(c.lower()) != 1 else c.lower() for c in text)
+
+
+class LexiconMatcher:
+    """Finds every lexicon entry (single words and multi-word phrases) in one pass.
+
+    Each distinct word is looked up in the lexicon once, and phrases are
+    followed word by word through the lexicon's prefix entries, so matching
+    cost depends on the length of the text and not on the number of entries.
+    Phrases only match when their words are separated by plain whitespace,
+    and the longest phrase starting at a given word wins.
+    """
+
+    def __init__(self, lexicon):
+        self.lexicon = lexicon
+
+    def finditer(self, text):
+        """Yield (start, end, key) for each non-overlapping match in text, in order."""
+        lowered = _lower_aligned(text)
+        matches = list(_WORD.finditer(lowered))
+        words = [match.group() for match in matches]
+        records = self.lexicon.records(words)
+        lookup = self.lexicon.lookup
+        count = len(words)
+        skip_until = -1
+        for i in [i for i, word in enumerate(words) if records[word][0]]:
+            if i <= skip_until:
+                continue
+            flags = records[words[i]][0]
+            phrase = words[i]
+            key = phrase if flags & TERMINAL else None
+            last = i
+            # Keep the longest phrase starting at this word
+            j = i + 1
+            while flags & PREFIX and j < count and lowered[matches[j - 1].end():matches[j].start()].isspace():
+                phrase = phrase + ' ' + words[j]
+                flags = lookup(phrase)[0]
+                if flags & TERMINAL:
+                    key, last = phrase, j
+                j += 1
+            if key is not None:
+                yield matches[i].start(), matches[last].end(), key
+                skip_until = last
+
+    def keys(self, text):
+        """Return the key of each non-overlapping match in text, in order.
+
+        Cheaper than finditer, since matches are found from the words alone
+        and never located in the text, but phrases also match across
+        punctuation.
+        """
+        words = text.lower().translate(_SEPARATOR_TABLE).split()
+        lookup = self.lexicon.lookup
+        records = self.lexicon.records(words)
+        keys = []
+        skip_until = -1
+        count = len(words)
+        for i in [i for i, word in enumerate(words) if records[word][0]]:
+            if i <= skip_until:
+                continue
+            word = words[i]
+            flags = records[word][0]
+            key = word if flags & TERMINAL else None
+            last = i
+            # Keep the longest phrase starting at this word
+            phrase = word
+            j = i + 1
+            while flags & PREFIX and j < count:
+                phrase = phrase + ' ' + words[j]
+                flags = lookup(phrase)[0]
+                if flags & TERMINAL:
+                    key, last = phrase, j
+                j += 1
+            if key is not None:
+                keys.append(key)
+                skip_until = last
+        return keys
+
+    def replace(self, text, choose):
+        """Rewrite text, asking choose(key, matched_text) for each match.
+
+        choose returns the replacement string, or None to keep the original.
+        The output is assembled from slices of the input in a single join.
+        """
+        pieces = []
+        last = 0
+        for start, end, key in self.finditer(text):
+            replacement = choose(key, text[start:end])
+            if replacement is None:
+                continue
+            pieces.append(text[last:start])
+            pieces.append(replacement)
+            last = end
+
+        if not pieces:
+            return text
+        pieces.append(text[last:])
+        return ''.join(pieces)
@@ -0,0 +1,171 @@
+"""Low-overhead counters and histograms, exported in Prometheus text format.
+
+Set PARAPHRASER_METRICS=0 in the environment to turn instrumentation off; the
+engines then skip all bookkeeping apart from reading the clock.
+"""
+import bisect
+import os
+import threading
+import time
+
+ENABLED = os.environ.get('PARAPHRASER_METRICS', '1') != '0'
+
+# Default latency buckets, in seconds
+LATENCY_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10, 60)
+
+
+def _format_labels(names, values, extra=''):
+    pairs = [f'{name}="{str(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Counter:
+    """A monotonically increasing count, per combination of label values."""
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        if not ENABLED:
+            return
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} counter']
+        with self._lock:
+            values = sorted(self._values.items())
+        for label_values, value in values:
+            lines.append(f'{self.name}{_format_labels(self.labels, label_values)} {value}')
+        return lines
+
+
+class Histogram:
+    """Observations counted into cumulative buckets, per combination of label values."""
+
+    def __init__(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        # label values -> [count per bucket..., count above the last bucket, sum]
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        if not ENABLED:
+            return
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._values.get(label_values)
+            if counts is None:
+                counts = self._values[label_values] = [0] * (len(self.buckets) + 1) + [0.0]
+            counts[index] += 1
+            counts[-1] += value
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            values = sorted((label_values, list(counts)) for label_values, counts in self._values.items())
+        for label_values, counts in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                labels = _format_labels(self.labels, label_values, f'le="{bound}"')
+                lines.append(f'{self.name}_bucket{labels} {cumulative}')
+            cumulative += counts[len(self.buckets)]
+            labels = _format_labels(self.labels, label_values, 'le="+Inf"')
+            lines.append(f'{self.name}_bucket{labels} {cumulative}')
+            lines.append(f'{self.name}_sum{_format_labels(self.labels, label_values)} {counts[-1]}')
+            lines.append(f'{self.name}_count{_format_labels(self.labels, label_values)} {cumulative}')
+        return lines
+
+
+class Registry:
+    """The set of metrics exported together."""
+
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        """Return every metric in the Prometheus text exposition format."""
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+REQUESTS = REGISTRY.register(Counter(
+    'paraphraser_requests_total', 'Requests handled, by endpoint, engine and status.',
+    ('endpoint', 'engine', 'status')))
+REQUEST_SECONDS = REGISTRY.register(Histogram(
+    'paraphraser_request_seconds', 'Time to produce a response, by endpoint.', ('endpoint',)))
+REQUEST_CHARS = REGISTRY.register(Histogram(
+    'paraphraser_request_chars', 'Characters of input text per request, by endpoint.', ('endpoint',),
+    buckets=(100, 1000, 10000, 100000, 1000000, 10000000)))
+CACHE_LOOKUPS = REGISTRY.register(Counter(
+    'paraphraser_cache_lookups_total', 'Result cache lookups, by engine and result (hit or miss).',
+    ('engine', 'result')))
+REJECTED = REGISTRY.register(Counter(
+    'paraphraser_rejected_total', 'Requests turned away by admission control, by lane and reason.',
+    ('lane', 'reason')))
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    'paraphraser_stage_seconds', 'Time spent in each stage of one paraphrase call, by engine and stage.',
+    ('engine', 'stage')))
+ML_BATCH_SIZE = REGISTRY.register(Histogram(
+    'paraphraser_ml_batch_size', 'Requests per generate call of the ML inference worker.', (),
+    buckets=(1, 2, 4, 8, 16, 32, 64)))
+ML_SENTENCES = REGISTRY.register(Counter(
+    'paraphraser_ml_sentences_total',
+    'Sentences given to the ML engine, by where their paraphrase came from (model, memo or duplicate).',
+    ('source',)))
+
+
+class StageTimer:
+    """Adds up the time spent in each stage of one call, then records the totals.
+
+    Totals are kept locally and recorded once per call, so stages that run
+    once per segment don't cost a histogram update per segment.
+    """
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.totals = {}
+
+    def add(self, stage, start):
+        """Add the time since start (a time.perf_counter() reading) to stage."""
+        self.totals[stage] = self.totals.get(stage, 0.0) + time.perf_counter() - start
+
+    def observe(self):
+        """Record the totals in STAGE_SECONDS."""
+        for stage, total in self.totals.items():
+            STAGE_SECONDS.observe(total, self.engine, stage)
+        self.totals.clear()
+
+
+class _NullStageTimer:
+    def add(self, stage, start):
+        pass
+
+    def observe(self):
+        pass
+
+
+NULL_STAGE_TIMER = _NullStageTimer()
+
+
+def stage_timer(engine):
+    """Return a StageTimer for one call, or a no-op one when metrics are disabled."""
+    return StageTimer(engine) if ENABLED else NULL_STAGE_TIMER
@@ -0,0 +1,141 @@
+"""Process-pool batch paraphrasing for the rule-based engines.
+
+Each engine class gets one persistent pool per worker count.  Workers build
+their engine once, from the same compiled lexicon file as the parent, and then
+serve chunks of texts for the lifetime of the process.
+"""
+import collections
+import importlib
+import itertools
+import os
+import random
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from lexicon import load_lexicon
+
+# Below this many texts per chunk, pool overhead outweighs the parallelism
+MIN_CHUNK_SIZE = 8
+# Chunks per worker; more chunks balance uneven texts at the cost of overhead
+CHUNKS_PER_WORKER = 4
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+_worker_engine = None
+
+
+def _init_worker(module_name, class_name, lexicon_path):
+    """Build the worker's engine once, when the pool process starts."""
+    global _worker_engine
+    # Forked workers inherit the parent's random state; give each its own
+    random.seed()
+    engine_class = getattr(importlib.import_module(module_name), class_name)
+    _worker_engine = engine_class(load_lexicon(lexicon_path))
+
+
+def _paraphrase(engine, text, seed=None, candidates=1):
+    """Paraphrase one text, as the best of candidates paraphrases if there is more than one."""
+    if candidates <= 1:
+        return engine.paraphrase(text, seed)
+    return engine.paraphrase_ranked(text, 1, candidates, seed)[0]
+
+
+def _paraphrase_chunk(texts, seed=None, candidates=1):
+    return [_paraphrase(_worker_engine, text, seed, candidates) for text in texts]
+
+
+def default_workers():
+    """Number of worker processes to use when none is given."""
+    return os.cpu_count() or 1
+
+
+def get_pool(engine, workers):
+    """Return the persistent pool serving engines like this one."""
+    engine_class = type(engine)
+    key = (engine_class.__module__, engine_class.__qualname__, engine.lexicon.path, workers)
+    pool = _pools.get(key)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(key)
+            if pool is None:
+                pool = _pools[key] = ProcessPoolExecutor(
+                    max_workers=workers,
+                    initializer=_init_worker,
+                    initargs=key[:3],
+                )
+    return pool
+
+
+def warm_pool(engine, workers=None):
+    """Start every worker in engine's pool so the first batch doesn't pay for it.
+
+    Returns the pool, or None for workers=1, where batches run inline.
+    """
+    workers = workers or default_workers()
+    if workers <= 1:
+        return None
+    pool = get_pool(engine, workers)
+    list(pool.map(_paraphrase_chunk, [[]] * workers))
+    return pool
+
+
+def paraphrase_batch(engine, texts, workers=None, seed=None, candidates=1):
+    """Paraphrase texts with engine across a process pool, keeping input order.
+
+    Small batches, or workers=1, run inline in the calling process.  A seed is
+    applied to each text separately, so results don't depend on chunking.
+    With candidates > 1, each text gets the best scoring of that many
+    paraphrases (engine.paraphrase_ranked).
+    """
+    texts = list(texts)
+    workers = workers or default_workers()
+    if workers <= 1 or len(texts) < 2 * MIN_CHUNK_SIZE:
+        return [_paraphrase(engine, text, seed, candidates) for text in texts]
+
+    chunk_size = max(MIN_CHUNK_SIZE, -(-len(texts) // (workers * CHUNKS_PER_WORKER)))
+    chunks = [texts[i:i + chunk_size] for i in range(0, len(texts), chunk_size)]
+    results = []
+    for chunk_result in get_pool(engine, workers).map(
+            _paraphrase_chunk, chunks, itertools.repeat(seed), itertools.repeat(candidates)):
+        results.extend(chunk_result)
+    return results
+
+
+def paraphrase_chunks(engine, chunks, workers=None, seed=None, max_in_flight=None):
+    """Yield the paraphrases of each chunk (a list of texts) from engine's pool, in order.
+
+    Chunks are taken from the iterable only as results are consumed, with at
+    most max_in_flight (by default two per worker) submitted at once, so
+    memory stays bounded however many chunks there are.  workers=1 runs
+    inline in the calling process.
+    """
+    workers = workers or default_workers()
+    if workers <= 1:
+        for texts in chunks:
+            yield [engine.paraphrase(text, seed) for text in texts]
+        return
+
+    max_in_flight = max_in_flight or 2 * workers
+    pool = get_pool(engine, workers)
+    pending = collections.deque()
+    try:
+        for texts in chunks:
+            pending.append(pool.submit(_paraphrase_chunk, texts, seed))
+            if len(pending) >= max_in_flight:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        # Don't leave queued work behind if the caller stops early
+        for future in pending:
+            future.cancel()
+
+
+def shutdown_pools():
+    """Stop every worker pool (they are also stopped at interpreter exit)."""
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.shutdown()
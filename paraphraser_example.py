@@ -1,51 +1,474 @@
-from transformers import AutoTokenizer, AutoModelForSeq2SeqLM
-import torch
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+import importlib.util
+import os
+import queue
+import re
+import threading
+import time
+import unicodedata
 
-# Load a pre-trained model that's specifically fine-tuned for paraphrasing
+from cache import LRUCache, ParaphraseCache, SqliteCache, make_key
+import enhanced_paraphraser
+import metrics
+import scoring
+
+# A pre-trained model that's specifically fine-tuned for paraphrasing
 # "Vamsi/T5_Paraphrase" is a community model fine-tuned for paraphrasing
-tokenizer = AutoTokenizer.from_pretrained("Vamsi/T5_Paraphrase")
-model = AutoModelForSeq2SeqLM.from_pretrained("Vamsi/T5_Paraphrase")
+# (torch and transformers are only imported when it is loaded)
+MODEL_NAME = "Vamsi/T5_Paraphrase"
+
+# Packages the model needs
+DEPENDENCIES = ("torch", "transformers")
+
+# Text paraphrased by warm_up to run the first generate call ahead of requests
+WARM_UP_TEXT = "The quick brown fox jumps over the lazy dog."
+
+# Longest input (in tokens) the model is given; longer inputs are truncated
+MAX_INPUT_LENGTH = 256
+
+# Texts are split into sentences, which are paraphrased separately and joined
+# back together.  Sentences longer than this many tokens are split between
+# words; pieces are kept well under MAX_INPUT_LENGTH because the generate call
+# slows down with the length of its inputs and outputs.
+MAX_SENTENCE_TOKENS = 128
+
+# Memo of paraphrased sentences, so boilerplate repeated across requests
+# (disclaimers, headers, templated phrasing) only goes through the model once.
+# The in-process memo holds up to MEMO_SIZE characters of sentences and
+# paraphrases.  Set PARAPHRASER_ML_MEMO_PATH to a SQLite file to also keep
+# them on disk, shared between processes and restarts.
+MEMO_SIZE = 32 * 1024 * 1024
+MEMO_ENTRIES = 1000000
+MEMO_TTL = 7 * 24 * 3600  # seconds
+MEMO_PATH = os.environ.get('PARAPHRASER_ML_MEMO_PATH')
+MEMO_DISK_ENTRIES = 1000000
+
+WHITESPACE = re.compile(r'\s+')
+
+# Output length limit for each batch, from the length of its longest input
+OUTPUT_LENGTH_RATIO = 1.5
+OUTPUT_LENGTH_MARGIN = 16
+MAX_OUTPUT_LENGTH = 256
+
+# Generation parameters shared by every batch (max_length is set per batch
+# from the input length unless given here).  With num_return_sequences above
+# one, the best beams are all returned and scored against the input (see
+# scoring.py), which picks the best and passes over broken ones for free.
+GENERATION_KWARGS = dict(
+    num_beams=5,
+    num_return_sequences=5,
+    temperature=1.0,
+    top_k=50,
+    top_p=0.95,
+    early_stopping=True,
+    no_repeat_ngram_size=2,
+)
+
+# Inference profiles, selected with the PARAPHRASER_ML_PROFILE environment variable:
+# - quality: beam search with 5 beams on the full-precision model
+# - balanced: 2 beams, on a copy of the model with its linear layers quantized to int8
+# - fast: greedy decoding on the quantized model, which stops as soon as every
+#   output in the batch has ended
+# Set "compile" to run the model through torch.compile when it is loaded.  That
+# makes each step of generation cheaper, but the first call takes minutes.
+PROFILES = {
+    'quality': dict(generation_kwargs=GENERATION_KWARGS, quantize=False, compile=False),
+    'balanced': dict(
+        generation_kwargs=dict(num_beams=2, num_return_sequences=2, early_stopping=True, no_repeat_ngram_size=2),
+        quantize=True,
+        compile=False,
+    ),
+    'fast': dict(
+        generation_kwargs=dict(num_beams=1, do_sample=False, no_repeat_ngram_size=2),
+        quantize=True,
+        compile=False,
+    ),
+}
+INFERENCE_PROFILE = os.environ.get('PARAPHRASER_ML_PROFILE', 'quality')
+
+# Intra-op threads torch uses for inference (None keeps torch's default of one per core)
+INFERENCE_THREADS = None
+
+EMPTY_RESULT_MESSAGE = "Unable to generate paraphrase. Please try a different text or check model settings."
+
+def normalize_sentence(sentence):
+    """
+    Returns sentence in the form it is paraphrased and memoized in: NFKC
+    normalized, with runs of whitespace collapsed to single spaces.
+    """
+    return WHITESPACE.sub(' ', unicodedata.normalize('NFKC', sentence)).strip()
+
+def output_length(input_length):
+    """
+    Returns the output length limit for inputs of up to input_length tokens.
+    """
+    return min(MAX_OUTPUT_LENGTH, int(input_length * OUTPUT_LENGTH_RATIO) + OUTPUT_LENGTH_MARGIN)
+
+class InferenceWorker:
+    """
+    Serves paraphrase requests from one background thread in dynamic micro-batches.
+
+    Requests are queued and collected into a batch until max_batch_size is
+    reached or max_wait seconds have passed since the first one arrived.  The
+    batch is sorted by token length and split into buckets whose lengths are
+    within bucket_width of each other, and each bucket is padded only to its
+    own longest input and run through a single generate call.
+
+    Texts go through paraphrase_documents, which splits them into sentences
+    that are batched like any other requests.  With a memo (a ParaphraseCache),
+    sentences it has paraphrased before are served from the memo, under keys in
+    memo_namespace.
+    """
+
+    def __init__(self, model, tokenizer, max_batch_size=16, max_wait=0.01, bucket_width=32,
+                 generation_kwargs=None, memo=None, memo_namespace='ml'):
+        self.model = model
+        self.tokenizer = tokenizer
+        self.memo = memo
+        self.memo_namespace = memo_namespace
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.bucket_width = bucket_width
+        self.generation_kwargs = GENERATION_KWARGS if generation_kwargs is None else generation_kwargs
+        self._queue = queue.Queue()
+        # Fast tokenizers can't be used from two threads at once
+        self._tokenizer_lock = threading.Lock()
+        self._prefix_length = None
+        # Imported here so the module can be imported without torch installed
+        import torch
+        self._torch = torch
+        self._thread = threading.Thread(target=self._run, name="paraphrase-inference", daemon=True)
+        self._thread.start()
+
+    def submit(self, text):
+        """Queue a text and return a Future for its paraphrase."""
+        future = Future()
+        self._queue.put((text, future))
+        return future
+
+    def paraphrase(self, text, timeout=None):
+        """
+        Paraphrase one text, waiting for the batch it lands in.
+
+        If the result isn't ready within timeout seconds, the request is
+        withdrawn (unless it is already running) and TimeoutError is raised.
+        """
+        return self.paraphrase_many([text], timeout)[0]
+
+    def paraphrase_many(self, texts, timeout=None):
+        """Paraphrase several texts, keeping input order (timeout as for paraphrase)."""
+        futures = [self.submit(text) for text in texts]
+        deadline = None if timeout is None else time.monotonic() + timeout
+        try:
+            return [future.result(None if deadline is None else max(0, deadline - time.monotonic()))
+                    for future in futures]
+        except FutureTimeoutError:
+            for future in futures:
+                future.cancel()
+            raise
+
+    def paraphrase_documents(self, texts, timeout=None):
+        """
+        Paraphrase texts of any length, keeping input order (timeout as for paraphrase).
+
+        Each text is split into sentences.  A sentence that appears more than
+        once across the texts is paraphrased once, and sentences found in the
+        memo aren't paraphrased at all, so only sentences not seen before go
+        to the model.  They are submitted together, shortest first, so the
+        time taken grows with the number of batches they fill and not with
+        the number of sentences.
+        """
+        texts = list(texts)
+        timer = metrics.stage_timer('ml')
+        start = time.perf_counter()
+        documents = [self.split(text) for text in texts]
+        timer.add('splitting', start)
+
+        start = time.perf_counter()
+        # Each distinct sentence, in order of first appearance -> its index
+        indexes = {}
+        lengths = []
+        for document in documents:
+            for sentence, length in document:
+                if sentence not in indexes:
+                    indexes[sentence] = len(lengths)
+                    lengths.append(length)
+        sentences = list(indexes)
+        results = [None] * len(sentences)
+        keys = None
+        if self.memo is not None:
+            keys = [make_key(self.memo_namespace, None, sentence) for sentence in sentences]
+            results = [self.memo.get(key) for key in keys]
+        missing = [i for i, result in enumerate(results) if result is None]
+        timer.add('memo', start)
+        timer.observe()
+        metrics.ML_SENTENCES.inc('duplicate', amount=sum(map(len, documents)) - len(sentences))
+        metrics.ML_SENTENCES.inc('memo', amount=len(sentences) - len(missing))
+        metrics.ML_SENTENCES.inc('model', amount=len(missing))
+
+        # Similar lengths end up in the same batches
+        order = sorted(missing, key=lengths.__getitem__)
+        for i, result in zip(order, self.paraphrase_many([sentences[i] for i in order], timeout)):
+            results[i] = result
+            if keys is not None and result != EMPTY_RESULT_MESSAGE:
+                self.memo.set(keys[i], result)
+
+        paraphrased = []
+        for text, document in zip(texts, documents):
+            if not document:
+                # Nothing to paraphrase (e.g. only whitespace), so the text comes back as it was
+                paraphrased.append(text)
+                continue
+            pieces = [results[indexes[sentence]] for sentence, _ in document]
+            if len(pieces) > 1:
+                # Keep a sentence that couldn't be paraphrased rather than break up the text
+                pieces = [sentence if piece == EMPTY_RESULT_MESSAGE else piece
+                          for (sentence, _), piece in zip(document, pieces)]
+            paraphrased.append(' '.join(pieces))
+        return paraphrased
 
-def paraphrase_text(text_to_paraphrase):
+    def split(self, text):
+        """
+        Split text into [(sentence, token count)] of normalized sentences of up to MAX_SENTENCE_TOKENS tokens.
+
+        Sentences come from the enhanced paraphraser's segmentation and are
+        normalized with normalize_sentence.  A sentence too long for the model
+        is split between words.  A text with no sentences (e.g. empty or only
+        whitespace) has no pieces.
+        """
+        sentences = [sentence for sentence in map(normalize_sentence,
+                                                  enhanced_paraphraser.get_paraphraser().get_segments(text))
+                     if sentence]
+        if not sentences:
+            return []
+        with self._tokenizer_lock:
+            if self._prefix_length is None:
+                self._prefix_length = len(self.tokenizer("paraphrase:  </s>")["input_ids"])
+            lengths = [len(ids) for ids in self.tokenizer(sentences, add_special_tokens=False)["input_ids"]]
+        budget = MAX_SENTENCE_TOKENS - self._prefix_length
+
+        pieces = []
+        for sentence, length in zip(sentences, lengths):
+            if length <= budget:
+                pieces.append((sentence, length))
+                continue
+            # Split the sentence into roughly equal runs of words
+            words = sentence.split()
+            count = min(len(words), -(-length // budget))
+            size = -(-len(words) // count)
+            for i in range(0, len(words), size):
+                pieces.append((' '.join(words[i:i + size]), length * size // len(words)))
+        return pieces
+
+    def close(self):
+        """Stop the worker thread once the queued requests are done."""
+        self._queue.put(None)
+        self._thread.join()
+
+    def _collect(self):
+        """Block for the next request, then gather a batch until full or the deadline passes."""
+        first = self._queue.get()
+        if first is None:
+            return None
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is None:
+                # Finish this batch, then stop
+                self._queue.put(None)
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            if batch is None:
+                return
+            # Drop requests whose callers have already given up
+            batch = [(text, future) for text, future in batch if future.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            metrics.ML_BATCH_SIZE.observe(len(batch))
+            timer = metrics.stage_timer('ml')
+            try:
+                for bucket in self._buckets(batch, timer):
+                    self._generate(bucket, timer)
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+            timer.observe()
+
+    def _buckets(self, batch, timer=metrics.NULL_STAGE_TIMER):
+        """Tokenize a batch and split it into buckets of similar length."""
+        start = time.perf_counter()
+        # This model expects a specific prefix for paraphrasing task
+        input_texts = ["paraphrase: " + text + " </s>" for text, _ in batch]
+        with self._tokenizer_lock:
+            encoded = self.tokenizer(input_texts, max_length=MAX_INPUT_LENGTH, truncation=True)["input_ids"]
+        timer.add('tokenize', start)
+        # Each item is (input ids, text, future)
+        items = sorted(((ids, text, future) for ids, (text, future) in zip(encoded, batch)), key=lambda item: len(item[0]))
+
+        bucket = []
+        for item in items:
+            if bucket and len(item[0]) - len(bucket[0][0]) > self.bucket_width:
+                yield bucket
+                bucket = []
+            bucket.append(item)
+        if bucket:
+            yield bucket
+
+    def _generate(self, bucket, timer=metrics.NULL_STAGE_TIMER):
+        """Run one padded generate call for a bucket and resolve its futures."""
+        start = time.perf_counter()
+        # Pad only to the longest input in this bucket
+        with self._tokenizer_lock:
+            encoding = self.tokenizer.pad({"input_ids": [ids for ids, _, _ in bucket]}, return_tensors="pt")
+        timer.add('tokenize', start)
+
+        # Limit the output length by the input length, unless configured
+        generation_kwargs = self.generation_kwargs
+        if "max_length" not in generation_kwargs and "max_new_tokens" not in generation_kwargs:
+            generation_kwargs = dict(generation_kwargs, max_length=output_length(encoding["input_ids"].shape[1]))
+
+        start = time.perf_counter()
+        with self._torch.inference_mode():
+            outputs = self.model.generate(
+                input_ids=encoding["input_ids"],
+                attention_mask=encoding["attention_mask"],
+                **generation_kwargs
+            )
+        timer.add('generate', start)
+
+        start = time.perf_counter()
+        # Outputs come in groups of num_return_sequences per input
+        count = generation_kwargs.get("num_return_sequences", 1)
+        if generation_kwargs is not self.generation_kwargs:
+            # The limit above is for the longest input; cut each output to the
+            # limit for its own input, as if it had been generated on its own
+            outputs = [output[:output_length(len(bucket[index // count][0]))] for index, output in enumerate(outputs)]
+        with self._tokenizer_lock:
+            decoded = self.tokenizer.batch_decode(outputs, skip_special_tokens=True)
+        timer.add('decode', start)
+
+        start = time.perf_counter()
+        for index, (_, text, future) in enumerate(bucket):
+            candidates = [candidate for candidate in decoded[index * count:(index + 1) * count] if candidate.strip()]
+            # Handle any empty results
+            if not candidates:
+                future.set_result(EMPTY_RESULT_MESSAGE)
+            else:
+                future.set_result(scoring.best(text, candidates) if len(candidates) > 1 else candidates[0])
+        timer.add('scoring', start)
+
+_worker = None
+_worker_lock = threading.Lock()
+_memo = None
+
+def check_dependencies():
+    """Raise ImportError if torch or transformers isn't installed, without importing them."""
+    missing = [name for name in DEPENDENCIES if importlib.util.find_spec(name) is None]
+    if missing:
+        raise ImportError(f"No module named {', '.join(missing)}")
+
+def load_model():
+    """Load the tokenizer and model, downloading them on first use."""
+    from transformers import AutoTokenizer, AutoModelForSeq2SeqLM
+    tokenizer = AutoTokenizer.from_pretrained(MODEL_NAME)
+    model = AutoModelForSeq2SeqLM.from_pretrained(MODEL_NAME)
+    return model, tokenizer
+
+def prepare_model(model, profile, threads=None):
+    """
+    Returns model set up for inference with profile (one of PROFILES).
+
+    The model is put in eval mode, its linear layers are quantized to int8 and
+    it is compiled if the profile asks for it.  Quantizing works on a copy, so
+    the model passed in is left as it was.  threads sets torch's intra-op
+    threads for the whole process.
+    """
+    import torch
+    if threads:
+        torch.set_num_threads(threads)
+    model.eval()
+    if profile.get('quantize'):
+        model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    if profile.get('compile'):
+        # Input and output lengths change from batch to batch, so compile once
+        # for dynamic shapes rather than once per shape
+        model.forward = torch.compile(model.forward, dynamic=True)
+    return model
+
+def get_memo():
+    """Return the shared sentence memo, creating it on first use."""
+    global _memo
+    if _memo is None:
+        shared = SqliteCache(MEMO_PATH, MEMO_DISK_ENTRIES, MEMO_TTL) if MEMO_PATH else None
+        _memo = ParaphraseCache(LRUCache(MEMO_ENTRIES, MEMO_TTL, max_size=MEMO_SIZE), shared)
+    return _memo
+
+def get_worker():
+    """Return the shared inference worker, loading the model and starting it on first use."""
+    global _worker
+    if _worker is None:
+        with _worker_lock:
+            if _worker is None:
+                if INFERENCE_PROFILE not in PROFILES:
+                    raise ValueError(f"Unknown inference profile {INFERENCE_PROFILE!r}, expected one of {', '.join(PROFILES)}")
+                profile = PROFILES[INFERENCE_PROFILE]
+                model, tokenizer = load_model()
+                model = prepare_model(model, profile, INFERENCE_THREADS)
+                _worker = InferenceWorker(model, tokenizer, generation_kwargs=profile['generation_kwargs'],
+                                          memo=get_memo(), memo_namespace=cache_namespace() + ':sentence')
+    return _worker
+
+def warm_up(workers=None, start_pool=False):
+    """Load the model and run one paraphrase, so the first request doesn't wait for either.
+
+    Batches share the inference worker, so workers and start_pool are accepted for interface compatibility and ignored.
+    """
+    get_worker().paraphrase(WARM_UP_TEXT)
+
+def paraphrase_text(text_to_paraphrase, seed=None, timeout=None):
     """
     Paraphrases the input text using a pre-trained model fine-tuned for paraphrasing.
+
+    Concurrent calls share forward passes through the inference worker.  Texts
+    of any length are accepted: they are split into sentences, and only those
+    not paraphrased before are run through the model, in batches.  Beam search is deterministic, so seed
+    is accepted for interface compatibility and ignored.  A request not yet
+    started after timeout seconds is dropped.
+    """
+    return get_worker().paraphrase_documents([text_to_paraphrase], timeout)[0]
+
+def paraphrase_batch(texts, workers=None, seed=None, timeout=None):
+    """
+    Paraphrases a list of texts, keeping input order.
+
+    The texts are batched together by the inference worker, and a sentence
+    repeated across them is paraphrased once.  The model already
+    uses every core through torch's intra-op threads, and beam search is
+    deterministic, so workers and seed are accepted for interface
+    compatibility and ignored.
+    """
+    return get_worker().paraphrase_documents(texts, timeout)
+
+def cache_namespace(seed=None):
+    """
+    Returns the namespace for caching results.  Beam search and greedy decoding
+    always give the same output for the same input, so results are cached with
+    or without a seed.  Each inference profile gives different results.
     """
-    # This model expects a specific prefix for paraphrasing task
-    input_text = "paraphrase: " + text_to_paraphrase + " </s>"
-
-    # Encode the input text
-    encoding = tokenizer.encode_plus(
-        input_text,
-        padding='max_length',
-        max_length=256,
-        truncation=True,
-        return_tensors="pt"
-    )
-    input_ids = encoding["input_ids"]
-    attention_mask = encoding["attention_mask"]
-
-    # Generate paraphrased text with improved parameters
-    with torch.no_grad():
-        outputs = model.generate(
-            input_ids=input_ids,
-            attention_mask=attention_mask,
-            max_length=256,
-            num_beams=5,
-            num_return_sequences=1,
-            temperature=1.0,
-            top_k=50,
-            top_p=0.95,
-            early_stopping=True,
-            no_repeat_ngram_size=2
-        )
-    
-    # Decode the generated output
-    paraphrased_text = tokenizer.decode(outputs[0], skip_special_tokens=True)
-    
-    # Return the paraphrased text, handling any empty results
-    if not paraphrased_text.strip():
-        return "Unable to generate paraphrase. Please try a different text or check model settings."
-    return paraphrased_text
+    return f"ml:{MODEL_NAME}:{INFERENCE_PROFILE}:sentences-{MAX_SENTENCE_TOKENS}:scored"
 
 # Example usage:
 if __name__ == "__main__":
@@ -0,0 +1,131 @@
+"""Admission control for the paraphrasing service.
+
+Work is split into lanes (e.g. one for the cheap rule-based engines and one
+for the ML engine), each with its own worker threads and a bounded number of
+queued requests.  A lane that is full rejects new work straight away instead
+of letting it pile up, and every request carries a deadline after which it is
+abandoned, so a saturated lane never holds up the others.  Streamed responses
+have a deadline per step instead, so a long stream can run for as long as it
+keeps making progress.
+"""
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+import threading
+import time
+
+
+class Overloaded(Exception):
+    """Raised when a lane has no room for another request."""
+
+    def __init__(self, lane, retry_after=1):
+        super().__init__(f"The {lane} lane is at capacity, please retry later")
+        self.lane = lane
+        self.retry_after = retry_after
+
+
+class DeadlineExceeded(Exception):
+    """Raised when a request doesn't finish before its deadline."""
+
+    def __init__(self, lane, timeout):
+        super().__init__(f"Request did not complete within {timeout} seconds")
+        self.lane = lane
+        self.timeout = timeout
+
+
+class Lane:
+    """A fixed number of worker threads with a bounded queue in front of them."""
+
+    def __init__(self, name, concurrency, queue_size, timeout, stream_timeout=None):
+        self.name = name
+        self.concurrency = concurrency
+        self.queue_size = queue_size
+        self.timeout = timeout
+        # Longest wait between two steps of admitted work, e.g. segments of a stream
+        self.stream_timeout = timeout if stream_timeout is None else stream_timeout
+        # One slot per running or queued request
+        self._slots = threading.BoundedSemaphore(concurrency + queue_size)
+        self._executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix=f"lane-{name}")
+
+    def _acquire(self):
+        if not self._slots.acquire(blocking=False):
+            raise Overloaded(self.name)
+
+    def call(self, fn, *args, **kwargs):
+        """Run fn on one of the lane's threads and wait for it, up to the lane's timeout.
+
+        Raises Overloaded if the lane is full, and DeadlineExceeded if the
+        result isn't ready in time.  A request still waiting in the queue at
+        its deadline is dropped without running.
+        """
+        self._acquire()
+        deadline = time.monotonic() + self.timeout
+        try:
+            future = self._executor.submit(self._run, deadline, fn, args, kwargs)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        try:
+            return future.result(self.timeout)
+        except FutureTimeoutError:
+            future.cancel()
+            raise DeadlineExceeded(self.name, self.timeout) from None
+
+    def _run(self, deadline, fn, args, kwargs):
+        if time.monotonic() > deadline:
+            raise DeadlineExceeded(self.name, self.timeout)
+        return fn(*args, **kwargs)
+
+    def admit(self):
+        """Take a slot for work the caller does itself, e.g. while streaming a response.
+
+        Raises Overloaded if the lane is full.  The returned Admission must be
+        released when the work is done; it can also be used as a context manager.
+        Its deadline is the lane's stream_timeout, counted from the last check.
+        """
+        self._acquire()
+        return Admission(self, self.stream_timeout)
+
+
+class Admission:
+    """A slot held in a lane, with a deadline for each step of the work holding it."""
+
+    def __init__(self, lane, timeout):
+        self.lane = lane
+        self.timeout = timeout
+        self.deadline = time.monotonic() + timeout
+        self._released = False
+        self._lock = threading.Lock()
+
+    def check(self):
+        """Raise DeadlineExceeded if the deadline has passed, and otherwise start the next step's."""
+        now = time.monotonic()
+        if now > self.deadline:
+            raise DeadlineExceeded(self.lane.name, self.timeout)
+        self.deadline = now + self.timeout
+
+    def release(self):
+        """Give the slot back; calling this more than once is harmless."""
+        with self._lock:
+            if self._released:
+                return
+            self._released = True
+        self.lane._slots.release()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+
+class Scheduler:
+    """Routes requests to named lanes."""
+
+    def __init__(self, lanes):
+        self.lanes = {name: Lane(name, **settings) for name, settings in lanes.items()}
+
+    def call(self, lane, fn, *args, **kwargs):
+        return self.lanes[lane].call(fn, *args, **kwargs)
+
+    def admit(self, lane):
+        return self.lanes[lane].admit()
@@ -0,0 +1,112 @@
+"""Scoring of candidate paraphrases against their source text.
+
+Every candidate is turned into word and word-pair (bigram) count vectors, the
+pairs hashed into a fixed number of dimensions, and all of them are scored
+together against the source with NumPy, so picking the best of 50
+paragraph-length candidates costs a few milliseconds:
+
+- overlap: cosine similarity of the word counts, i.e. how much of the
+  source's vocabulary survives
+- novelty: the fraction of the candidate's word pairs that aren't in the
+  source, i.e. how much it was actually rephrased
+- length: how far the candidate's length strays from the source's
+- malformed: the number of places that look like a rule misfired, such as
+  "the is makesed by"
+
+The best candidate has the highest weighted sum.
+"""
+import collections
+import itertools
+import re
+
+import numpy as np
+
+# Word pairs are hashed into this many dimensions
+BIGRAM_DIMENSIONS = 1 << 12
+
+# Weights of each score in the total
+OVERLAP_WEIGHT = 1.0
+NOVELTY_WEIGHT = 0.5
+LENGTH_WEIGHT = 1.0
+# Per malformed place; outweighs everything else, so a clean candidate always wins
+MALFORMED_WEIGHT = 2.0
+
+# Telltale output of rules that misfired, as checks on the tokens: a word
+# pair that never appears in good output (the active-to-passive rule applied
+# to something that wasn't a verb and object), a verb given both -s and -ed
+# (e.g. "makesed"), the same word twice in a row, or punctuation piled up
+# (e.g. "machines.," after a transition)
+MALFORMED_PAIRS = [('the', 'is')]
+MALFORMED_WORD = re.compile(r'\w+esed')
+PUNCTUATION = ',.;:'
+
+# Words, and punctuation as tokens of its own
+TOKEN = re.compile(r'\w+|[^\w\s]')
+
+
+def score(source, candidates):
+    """Return an array with the score of each candidate paraphrase of source."""
+    texts = [source] + list(candidates)
+    tokens = [TOKEN.findall(text.lower()) for text in texts]
+    lengths = np.array([len(words) for words in tokens])
+    # Number every distinct token; the numbers are only used within this call
+    vocabulary = collections.defaultdict(itertools.count().__next__)
+    ids = np.fromiter(map(vocabulary.__getitem__, itertools.chain.from_iterable(tokens)),
+                      dtype=np.int64, count=int(lengths.sum()))
+    rows = np.repeat(np.arange(len(texts)), lengths)
+    size = max(len(vocabulary), 1)
+
+    words = np.bincount(rows * size + ids, minlength=len(texts) * size).reshape(len(texts), size).astype(np.float64)
+    norms = np.linalg.norm(words, axis=1)
+    overlap = words[1:] @ words[0] / np.maximum(norms[1:] * norms[0], 1e-12)
+
+    # Word pairs are only counted sparsely: each candidate's distinct pairs
+    # against a dense vector of the source's
+    same_row = rows[:-1] == rows[1:]
+    pair_rows = rows[:-1][same_row]
+    pairs = (ids[:-1][same_row] * size + ids[1:][same_row]) % BIGRAM_DIMENSIONS
+    source_pairs = np.bincount(pairs[pair_rows == 0], minlength=BIGRAM_DIMENSIONS)
+    keys, counts = np.unique(pair_rows * BIGRAM_DIMENSIONS + pairs, return_counts=True)
+    key_rows = keys // BIGRAM_DIMENSIONS
+    shared = np.bincount(key_rows, np.minimum(counts, source_pairs[keys % BIGRAM_DIMENSIONS]), minlength=len(texts))[1:]
+    total = np.bincount(pair_rows, minlength=len(texts))[1:]
+    novelty = np.where(total > 0, 1 - shared / np.maximum(total, 1), 0)
+    ratio = np.array([len(candidate) for candidate in texts[1:]], dtype=np.float64) / max(len(source), 1)
+    length = np.abs(np.log(np.maximum(ratio, 1e-3)))
+    malformed = _count_malformed(vocabulary, ids, rows, same_row, len(texts))[1:]
+
+    return (OVERLAP_WEIGHT * overlap + NOVELTY_WEIGHT * novelty
+            - LENGTH_WEIGHT * length - MALFORMED_WEIGHT * malformed)
+
+
+def _count_malformed(vocabulary, ids, rows, same_row, count):
+    """Return the number of malformed places in each text, from its tokens."""
+    is_word = np.zeros(max(len(vocabulary), 1), dtype=bool)
+    is_punctuation = np.zeros_like(is_word)
+    is_malformed = np.zeros_like(is_word)
+    for token, index in vocabulary.items():
+        is_word[index] = token[0].isalnum() or token[0] == '_'
+        is_punctuation[index] = token in PUNCTUATION
+        is_malformed[index] = MALFORMED_WORD.fullmatch(token) is not None
+    first, second = ids[:-1], ids[1:]
+    pairs = ((first == second) & is_word[first]) | (is_punctuation[first] & is_punctuation[second])
+    for word, following in MALFORMED_PAIRS:
+        if word in vocabulary and following in vocabulary:
+            pairs |= (first == vocabulary[word]) & (second == vocabulary[following])
+    return (np.bincount(rows[:-1][pairs & same_row], minlength=count)
+            + np.bincount(rows[is_malformed[ids]], minlength=count))
+
+
+def rank(source, candidates):
+    """Return the candidates from best to worst (ties keep their order)."""
+    candidates = list(candidates)
+    scores = score(source, candidates)
+    return [candidates[i] for i in np.argsort(-scores, kind='stable')]
+
+
+def best(source, candidates):
+    """Return the best candidate paraphrase of source."""
+    candidates = list(candidates)
+    if not candidates:
+        raise ValueError("no candidates to choose from")
+    return candidates[int(np.argmax(score(source, candidates)))]
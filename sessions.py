@@ -0,0 +1,229 @@
+"""Incremental paraphrasing of documents that are being edited.
+
+A session holds a document's text, its segments and the paraphrase of each
+one.  Every random choice is drawn from a generator seeded with the session
+seed and the hash of the segment it concerns (or of the two segments either
+side of a boundary, for transition words), so the paraphrase of a segment
+only depends on its own text and its neighbours'.  An edit re-segments and
+re-paraphrases just the segments it touches plus one on either side, and the
+rest of the document is reused as it is.  Segments are never reordered, so
+sentences the user didn't touch stay where they are.
+"""
+import bisect
+import hashlib
+import random
+import threading
+
+# Chance of a transition word between two segments, as in EnhancedParaphraser
+TRANSITION_PROBABILITY = 0.4
+
+
+class VersionConflict(Exception):
+    """Raised when edits are based on a different version of the document than the session's."""
+
+
+class DocumentTooLong(Exception):
+    """Raised when an edit would make the document longer than the session allows."""
+
+
+def segment_hash(segment):
+    """Stable hash of a segment's text, the same in every process."""
+    return hashlib.blake2b(segment.encode('utf-8'), digest_size=16).hexdigest()
+
+
+class EditingSession:
+    """A document paraphrased segment by segment, updated by whole texts or by edits.
+
+    Every update returns the change to the paraphrased segments as a dict:
+    replace segments[start:end] of the previous version with segments, which
+    gives version.  Joining the segments with spaces gives the paraphrase.
+    paraphraser is an EnhancedParaphraser (anything with iter_segments,
+    paraphrase_segment and transition_words).
+    """
+
+    def __init__(self, paraphraser, seed=None, max_length=None):
+        self.paraphraser = paraphraser
+        # Unseeded sessions still need the same choices on every edit
+        self.seed = seed if seed is not None else random.getrandbits(64)
+        self.max_length = max_length
+        self.version = 0
+        self.text = ''
+        # Offsets of each segment in text, its hash and its rendered output
+        self.starts = []
+        self.ends = []
+        self.hashes = []
+        self.outputs = []
+        # Segment hash -> paraphrased segment, without transition words
+        self._paraphrases = {}
+        self.lock = threading.Lock()
+
+    @property
+    def paraphrased(self):
+        """The paraphrase of the whole document."""
+        return ' '.join(self.outputs)
+
+    def set_text(self, text, version=None):
+        """Replace the whole document, reusing the paraphrases of segments that haven't changed.
+
+        The change returned is against version, the version the caller has.
+        If that isn't the session's current version (e.g. None), the change is
+        against an empty document, i.e. it lists every segment.
+        """
+        with self.lock:
+            self._check_length(len(text))
+            starts, ends = self._segment(text, 0, len(text))
+            hashes = [segment_hash(text[start:end]) for start, end in zip(starts, ends)]
+            if version != self.version:
+                self.hashes = []
+                self.outputs = []
+
+            # Segments shared with the previous version at the start and end
+            limit = min(len(hashes), len(self.hashes))
+            prefix = 0
+            while prefix < limit and hashes[prefix] == self.hashes[prefix]:
+                prefix += 1
+            suffix = 0
+            while suffix < limit - prefix and hashes[-1 - suffix] == self.hashes[-1 - suffix]:
+                suffix += 1
+
+            old_count = len(self.hashes)
+            self.text = text
+            self.starts, self.ends, self.hashes = starts, ends, hashes
+            return self._rerender(prefix, old_count - suffix, len(hashes) - suffix)
+
+    def apply_edits(self, edits, version):
+        """Apply edits, in order, to the given version of the document.
+
+        Each edit is a dict replacing text[start:end] with text, with offsets
+        in characters of the document as left by the previous edit.  Raises
+        VersionConflict if version isn't the session's, ValueError for an
+        invalid edit and DocumentTooLong if the result would be too long; the
+        session is unchanged if any of these is raised.
+        """
+        with self.lock:
+            if version != self.version:
+                raise VersionConflict(f"Document is at version {self.version}, not {version}")
+            length = len(self.text)
+            for edit in edits:
+                if not isinstance(edit, dict):
+                    raise ValueError('each edit must be an object with start, end and text')
+                start, end, replacement = edit.get('start'), edit.get('end'), edit.get('text', '')
+                if not all(isinstance(offset, int) and not isinstance(offset, bool) for offset in (start, end)) \
+                        or not isinstance(replacement, str) or not 0 <= start <= end <= length:
+                    raise ValueError(f'edit offsets must be integers with 0 <= start <= end <= {length}')
+                length += len(replacement) - (end - start)
+            self._check_length(length)
+
+            changes = [self._apply_edit(edit['start'], edit['end'], edit.get('text', '')) for edit in edits]
+            return self._merge_changes(changes)
+
+    def _check_length(self, length):
+        if self.max_length is not None and length > self.max_length:
+            raise DocumentTooLong(f'Text is longer than {self.max_length} characters')
+
+    def _apply_edit(self, start, end, replacement):
+        count = len(self.hashes)
+        # Segments the edit touches (ends are inclusive, so typing at the end
+        # of a segment counts), then one more either side, then out to real
+        # sentence boundaries in case a segment was cut from a longer sentence
+        first = bisect.bisect_left(self.ends, start)
+        last = bisect.bisect_right(self.starts, end)
+        first = max(first - 1, 0)
+        last = min(last + 1, count)
+        while first > 0 and not self._is_boundary(first):
+            first -= 1
+        while last < count and not self._is_boundary(last):
+            last += 1
+
+        # The window runs to the ends of the document when it reaches them, to
+        # catch changes to leading and trailing whitespace
+        window_start = self.starts[first] if first > 0 else 0
+        window_end = self.ends[last - 1] if last < count else len(self.text)
+        delta = len(replacement) - (end - start)
+        self.text = self.text[:start] + replacement + self.text[end:]
+
+        starts, ends = self._segment(self.text, window_start, window_end + delta)
+        hashes = [segment_hash(self.text[segment_start:segment_end]) for segment_start, segment_end in zip(starts, ends)]
+        self.starts[first:] = starts + [offset + delta for offset in self.starts[last:]]
+        self.ends[first:] = ends + [offset + delta for offset in self.ends[last:]]
+        self.hashes[first:last] = hashes
+        return self._rerender(first, last, first + len(hashes))
+
+    def _is_boundary(self, index):
+        """Whether segments index - 1 and index are separate sentences, not pieces of one long one."""
+        gap_start = self.ends[index - 1]
+        return gap_start < self.starts[index] and self.text[gap_start - 1] in '.!?'
+
+    def _segment(self, text, start, end):
+        """Return the start and end offsets of the segments in text[start:end]."""
+        starts = []
+        ends = []
+        position = start
+        for segment in self.paraphraser.iter_segments(text[start:end]):
+            # Segments come in order, separated only by whitespace
+            segment_start = text.find(segment, position, end)
+            position = segment_start + len(segment)
+            starts.append(segment_start)
+            ends.append(position)
+        return starts, ends
+
+    def _rerender(self, first, old_end, new_end):
+        """Render segments first to new_end, replacing the outputs first to old_end, and return the change.
+
+        The segments either side are rendered again too, since their
+        transition words and punctuation depend on their neighbours.
+        """
+        first = max(first - 1, 0)
+        old_end = min(old_end + 1, len(self.outputs))
+        new_end = min(new_end + 1, len(self.hashes))
+        rendered = [self._render(index) for index in range(first, new_end)]
+        self.outputs[first:old_end] = rendered
+        self.version += 1
+
+        # Forget paraphrases of segments that are gone, once they pile up
+        if len(self._paraphrases) > 2 * len(self.hashes) + 64:
+            self._paraphrases = {key: self._paraphrases[key] for key in self.hashes if key in self._paraphrases}
+        return {'version': self.version, 'start': first, 'end': old_end, 'segments': rendered}
+
+    def _render(self, index):
+        """Return the output of one segment: its paraphrase with the transition words around it."""
+        key = self.hashes[index]
+        paraphrased = self._paraphrases.get(key)
+        if paraphrased is None:
+            segment = self.text[self.starts[index]:self.ends[index]]
+            rng = random.Random(f"{self.seed}:{key}")
+            paraphrased = self._paraphrases[key] = self.paraphraser.paraphrase_segment(segment, rng)
+
+        # A transition word at the start of the next segment turns this one's period into a comma
+        if index + 1 < len(self.hashes) and self._transition(index + 1) and paraphrased.endswith('.'):
+            paraphrased = paraphrased[:-1] + ','
+        transition = self._transition(index)
+        if transition:
+            paraphrased = f"{transition.lower()} {paraphrased}"
+        return paraphrased
+
+    def _transition(self, index):
+        """Return the transition word starting segment index, or None."""
+        if index == 0:
+            return None
+        rng = random.Random(f"{self.seed}:{self.hashes[index - 1]}:{self.hashes[index]}")
+        if rng.random() < TRANSITION_PROBABILITY:
+            return rng.choice(self.paraphraser.transition_words)
+        return None
+
+    def _merge_changes(self, changes):
+        """Combine the changes of consecutive edits into one against the version before the first."""
+        if not changes:
+            return {'version': self.version, 'start': 0, 'end': 0, 'segments': []}
+        # The changed range, as [start, old_end) before the first edit and [start, new_end) now
+        start = changes[0]['start']
+        old_end = changes[0]['end']
+        new_end = start + len(changes[0]['segments'])
+        for change in changes[1:]:
+            # Segments outside the range so far map one to one onto the previous version
+            if change['end'] > new_end:
+                old_end += change['end'] - new_end
+            shift = len(change['segments']) - (change['end'] - change['start'])
+            new_end = max(new_end, change['end']) + shift
+            start = min(start, change['start'])
+        return {'version': self.version, 'start': start, 'end': old_end, 'segments': self.outputs[start:new_end]}
@@ -1,57 +1,25 @@
+import functools
 import random
 import re
+import threading
+
+from lexicon import load_lexicon
+from lexicon_matcher import LexiconMatcher
+import parallel
+import scoring
+from transformations import TokenSequence
+
+# Text paraphrased by warm_up
+WARM_UP_TEXT = "Cloud computing is important for modern businesses."
 
 class SimpleParaphraser:
     """A simple rule-based paraphraser that uses predefined patterns and synonyms."""
     
-    def __init__(self):
-        # Word replacements (common words and their alternatives)
-        self.word_replacements = {
-            # Nouns
-            'environment': ['ecosystem', 'setting', 'domain', 'context'],
-            'resources': ['assets', 'components', 'elements', 'capabilities'],
-            'infrastructure': ['framework', 'foundation', 'structure', 'architecture'],
-            'efficiency': ['effectiveness', 'performance', 'productivity', 'efficacy'],
-            'sustainability': ['durability', 'resilience', 'viability', 'eco-friendliness'],
-            'energy': ['power', 'fuel', 'force'],
-            'methods': ['approaches', 'techniques', 'procedures', 'strategies'],
-            'machines': ['devices', 'equipment', 'systems', 'hardware'],
-            'models': ['frameworks', 'structures', 'designs', 'patterns'],
-            'tools': ['utilities', 'instruments', 'mechanisms', 'applications'],
-            'decisions': ['choices', 'judgments', 'determinations', 'selections'],
-            'techniques': ['methods', 'approaches', 'practices', 'procedures'],
-            'cloud': ['remote', 'distributed', 'networked', 'web-based'],
-            'computing': ['processing', 'calculation', 'data processing', 'information technology'],
-            'intelligence': ['intellect', 'reasoning', 'insight', 'cognitive ability'],
-            'heuristics': ['guidelines', 'rules of thumb', 'practical methods', 'strategies'],
-            'workloads': ['tasks', 'operations', 'processes', 'jobs'],
-            
-            # Verbs
-            'affect': ['influence', 'impact', 'modify', 'shape'],
-            'organized': ['arranged', 'structured', 'ordered', 'classified'],
-            'makes': ['creates', 'produces', 'generates', 'forms'],
-            'failed': ['underperformed', 'fallen short', 'been inadequate', 'not succeeded'],
-            'emerged': ['appeared', 'surfaced', 'arisen', 'come forth'],
-            'optimizing': ['improving', 'enhancing', 'refining', 'maximizing'],
-            'allocate': ['assign', 'distribute', 'designate', 'apportion'],
-            'manage': ['handle', 'control', 'administer', 'oversee'],
-            
-            # Adjectives
-            'complex': ['complicated', 'intricate', 'sophisticated', 'multifaceted'],
-            'dynamic': ['changing', 'fluid', 'evolving', 'adaptable'],
-            'optimal': ['best', 'ideal', 'superior', 'prime'],
-            'physical': ['tangible', 'material', 'concrete', 'actual'],
-            'virtual': ['digital', 'simulated', 'online', 'computer-based'],
-            'heterogeneous': ['diverse', 'varied', 'mixed', 'assorted'],
-            'promising': ['potential', 'hopeful', 'encouraging', 'prospective'],
-            'artificial': ['synthetic', 'manufactured', 'man-made', 'simulated'],
-            
-            # Phrases
-            'there are': ['we find', 'one can observe', 'it contains', 'we see'],
-            'significantly affect': ['greatly impact', 'considerably influence', 'substantially change', 'notably alter'],
-            'recently': ['lately', 'in recent times', 'not long ago', 'in the near past'],
-            'based on': ['founded on', 'derived from', 'grounded in', 'rooted in'],
-        }
+    def __init__(self, lexicon=None):
+        # Word replacements (common words and phrases and their alternatives),
+        # shared read-only by every instance in the process
+        self.lexicon = lexicon if lexicon is not None else load_lexicon('simple')
+        self.matcher = LexiconMatcher(self.lexicon)
         
         # Sentence structure variations
         self.sentence_structures = [
@@ -64,16 +32,33 @@ class SimpleParaphraser:
             lambda s: s,  # sometimes keep original structure
         ]
         
-        # Phrase reorderings
+        # Phrase reorderings (each equivalent to re.sub with the pattern and
+        # replacement in its comment, in linear time)
         self.reorderings = [
-            # "X and Y" -> "Y and X"
-            (r'(\w+) and (\w+)', r'\2 and \1'),
-            # "X, Y, and Z" -> "Z, X, and Y" 
-            (r'(\w+), (\w+), and (\w+)', r'\3, \1, and \2'),
+            # "X and Y" -> "Y and X": r'(\w+) and (\w+)' -> r'\2 and \1'
+            TokenSequence((' and ',), '{1} and {0}'),
+            # "X, Y, and Z" -> "Z, X, and Y": r'(\w+), (\w+), and (\w+)' -> r'\3, \1, and \2'
+            TokenSequence((', ', ', and '), '{2}, {0}, and {1}'),
         ]
         
-    def paraphrase(self, text):
-        """Paraphrase the given text using word replacements and structure changes."""
+    def choose_replacement(self, key, original, rng=random):
+        """Pick a replacement for a lexicon match, or None to keep the original."""
+        if rng.random() >= 0.3:
+            return None
+        replacement = rng.choice(self.lexicon[key])
+        # Preserve capitalization
+        if original[0].isupper():
+            replacement = replacement.capitalize()
+        return replacement
+        
+    def paraphrase(self, text, seed=None):
+        """Paraphrase the given text using word replacements and structure changes.
+        
+        With a seed, the same text always gives the same paraphrase.
+        """
+        rng = random.Random(seed) if seed is not None else random
+        choose_replacement = functools.partial(self.choose_replacement, rng=rng)
+        
         # Split text into sentences
         sentences = re.split(r'(?<=[.!?])\s+', text)
         paraphrased_sentences = []
@@ -82,39 +67,16 @@ class SimpleParaphraser:
             if not sentence.strip():
                 continue
                 
-            # 1. Word replacements (30% chance for each eligible word)
-            words = sentence.split()
-            for i in range(len(words)):
-                word_lower = words[i].lower().strip('.,;:!?()"\'')
-                
-                # Check if this word has replacements and we decide to replace it
-                if word_lower in self.word_replacements and random.random() < 0.3:
-                    # Choose a replacement
-                    replacement = random.choice(self.word_replacements[word_lower])
-                    
-                    # Preserve capitalization
-                    if words[i][0].isupper():
-                        replacement = replacement.capitalize()
-                    
-                    # Preserve punctuation
-                    for char in ',.:;!?()"\'-':
-                        if words[i].endswith(char):
-                            replacement += char
-                            break
-                    
-                    words[i] = replacement
-            
-            # Reconstruct the sentence
-            new_sentence = ' '.join(words)
+            # 1. Word replacements (30% chance for each eligible word or phrase)
+            new_sentence = self.matcher.replace(sentence, choose_replacement)
             
             # 2. Apply sentence structure variation (40% chance)
-            if random.random() < 0.4:
-                new_sentence = random.choice(self.sentence_structures)(new_sentence)
+            if rng.random() < 0.4:
+                new_sentence = rng.choice(self.sentence_structures)(new_sentence)
             
             # 3. Apply phrase reordering (20% chance)
-            if random.random() < 0.2:
-                reordering = random.choice(self.reorderings)
-                new_sentence = re.sub(reordering[0], reordering[1], new_sentence)
+            if rng.random() < 0.2:
+                new_sentence = rng.choice(self.reorderings).apply(new_sentence)
             
             paraphrased_sentences.append(new_sentence)
         
@@ -123,18 +85,84 @@ class SimpleParaphraser:
         
         # Optional: Add/remove transition words (10% chance)
         transition_words = ['however', 'furthermore', 'additionally', 'moreover', 'consequently']
-        if len(paraphrased_sentences) > 1 and random.random() < 0.1:
-            sentence_index = random.randint(1, len(paraphrased_sentences) - 1)
-            transition = random.choice(transition_words)
+        if len(paraphrased_sentences) > 1 and rng.random() < 0.1:
+            sentence_index = rng.randint(1, len(paraphrased_sentences) - 1)
+            transition = rng.choice(transition_words)
             paraphrased_sentences[sentence_index] = f"{transition.capitalize()}, {paraphrased_sentences[sentence_index].lower()}"
             paraphrased_text = ' '.join(paraphrased_sentences)
         
         return paraphrased_text
 
-def paraphrase_text(text):
+    def paraphrase_batch(self, texts, workers=None, seed=None, candidates=1):
+        """Paraphrase many texts across a pool of worker processes, keeping input order.
+        
+        With candidates > 1, each text gets the best of that many paraphrases, as from paraphrase_ranked.
+        """
+        return parallel.paraphrase_batch(self, texts, workers, seed, candidates)
+    
+    def paraphrase_variants(self, text, n, seed=None):
+        """Return n distinct paraphrases of text, or fewer if it doesn't have that many.
+        
+        With a seed, the same text always gives the same variants.
+        """
+        rng = random.Random(seed) if seed is not None else random
+        # A dict keeps the first occurrence of each variant, in order
+        variants = {}
+        for _ in range(n * 4):
+            variants.setdefault(self.paraphrase(text, rng.getrandbits(64)), None)
+            if len(variants) == n:
+                break
+        return list(variants)
+    
+    def paraphrase_ranked(self, text, n, candidates, seed=None):
+        """Return the n best of up to candidates distinct paraphrases of text, best first (see scoring.py)."""
+        return scoring.rank(text, self.paraphrase_variants(text, max(n, candidates), seed))[:n]
+
+_paraphraser = None
+_paraphraser_lock = threading.Lock()
+
+def get_paraphraser():
+    """Return the process-wide SimpleParaphraser, creating it on first use."""
+    global _paraphraser
+    if _paraphraser is None:
+        with _paraphraser_lock:
+            if _paraphraser is None:
+                _paraphraser = SimpleParaphraser()
+    return _paraphraser
+
+def warm_up(workers=None, start_pool=False):
+    """Function to load the shared instance and its lexicon ahead of the first request.
+
+    With start_pool, the pool of workers batch processes is started too, rather than on the first batch.
+    """
+    get_paraphraser().paraphrase(WARM_UP_TEXT, 0)
+    if start_pool:
+        parallel.warm_pool(get_paraphraser(), workers)
+
+def paraphrase_text(text, seed=None):
     """Function to interface with the paraphraser class."""
-    paraphraser = SimpleParaphraser()
-    return paraphraser.paraphrase(text)
+    return get_paraphraser().paraphrase(text, seed)
+
+def paraphrase_batch(texts, workers=None, seed=None, candidates=1):
+    """Function to paraphrase many texts in parallel with the shared instance."""
+    return get_paraphraser().paraphrase_batch(texts, workers, seed, candidates)
+
+def paraphrase_variants(text, n, seed=None):
+    """Function to produce several distinct paraphrases with the shared instance."""
+    return get_paraphraser().paraphrase_variants(text, n, seed)
+
+def paraphrase_ranked(text, n, candidates, seed=None):
+    """Function to produce the best of many candidate paraphrases with the shared instance."""
+    return get_paraphraser().paraphrase_ranked(text, n, candidates, seed)
+
+def cache_namespace(seed=None):
+    """Return the namespace for caching results, or None if they can't be cached.
+    
+    Unseeded results are random on every call, so only seeded ones are cached.
+    """
+    if seed is None:
+        return None
+    return f"simple:{get_paraphraser().lexicon.version}"
 
 # Example usage
 if __name__ == "__main__":
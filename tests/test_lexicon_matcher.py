@@ -0,0 +1,5 @@
+from benchmarks import matcher
+
+
+def test_finditer_matches_reference():
+    assert matcher.fuzz(iterations=300) == []
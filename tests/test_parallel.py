@@ -0,0 +1,22 @@
+import pytest
+
+from benchmarks.corpus import make_text
+from enhanced_paraphraser import EnhancedParaphraser
+import parallel
+
+
+@pytest.fixture
+def texts():
+    # Enough texts to be split into chunks across the pool
+    return [make_text(200, seed=i) for i in range(4 * parallel.MIN_CHUNK_SIZE)]
+
+
+@pytest.mark.parametrize('candidates', [1, 4])
+def test_pool_matches_inline(texts, candidates):
+    engine = EnhancedParaphraser()
+    try:
+        pooled = parallel.paraphrase_batch(engine, texts, workers=2, seed=3, candidates=candidates)
+    finally:
+        parallel.shutdown_pools()
+    inline = parallel.paraphrase_batch(engine, texts, workers=1, seed=3, candidates=candidates)
+    assert pooled == inline
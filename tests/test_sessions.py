@@ -0,0 +1,5 @@
+from benchmarks import sessions
+
+
+def test_session_matches_full_rerun():
+    assert sessions.fuzz(documents=5, edits=10) == []
@@ -0,0 +1,5 @@
+from benchmarks import transformations
+
+
+def test_transformations_match_regex():
+    assert transformations.fuzz(iterations=300) == []
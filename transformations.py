@@ -0,0 +1,199 @@
+"""Linear-time sentence transformations.
+
+Each transformation gives the same result as re.sub with one of the regular
+expressions the engines were written with, such as (.*?) and (.*?) or
+([\\w]+) ([\\w]+s) the, but finds its matches with str.find and by looking
+at the words next to each occurrence, instead of with a backtracking regex.
+Time grows linearly with the length of the segment, and segments longer than
+MAX_TRANSFORM_LENGTH are left alone.
+"""
+import re
+
+# Segments longer than this (in characters) are never transformed
+MAX_TRANSFORM_LENGTH = 100000
+
+# Runs of word characters, as matched by \w+
+WORD = re.compile(r'\w+')
+
+
+class Segment:
+    """A segment's text, with lookups of the words on either side of a position.
+
+    Words are runs of word characters, as for \\w+.  The reversed text used to
+    find where a word starts is built once, on first use.
+    """
+
+    __slots__ = ('text', '_reversed')
+
+    def __init__(self, text):
+        self.text = text
+        self._reversed = None
+
+    def word_end(self, position):
+        """End of the word starting at position (position itself if there is none)."""
+        match = WORD.match(self.text, position)
+        return match.end() if match else position
+
+    def word_start(self, position):
+        """Start of the word ending at position (position itself if there is none)."""
+        if self._reversed is None:
+            self._reversed = self.text[::-1]
+        match = WORD.match(self._reversed, len(self.text) - position)
+        return position - (match.end() - match.start()) if match else position
+
+
+class Transformation:
+    """Rewrites every non-overlapping match in a segment, leftmost first, like re.sub."""
+
+    # Text every match contains; segments without it are skipped straight away
+    required = ''
+
+    def apply(self, segment):
+        """Return the transformed text of segment (a string or a Segment)."""
+        text = segment.text if isinstance(segment, Segment) else segment
+        if len(text) > MAX_TRANSFORM_LENGTH or self.required not in text:
+            return text
+        if not isinstance(segment, Segment):
+            segment = Segment(text)
+
+        pieces = []
+        last = 0
+        for start, end, replacement in self.matches(segment):
+            pieces.append(text[last:start])
+            pieces.append(replacement)
+            last = end
+        if not pieces:
+            return text
+        pieces.append(text[last:])
+        return ''.join(pieces)
+
+    def matches(self, segment):
+        """Yield (start, end, replacement) for each match, in order."""
+        raise NotImplementedError
+
+
+class TokenSequence(Transformation):
+    """Consecutive words joined by fixed text, e.g. ([\\w]+) ([\\w]+s) the.
+
+    Matches prefix, then a word, then for each glue the glue and another word,
+    then suffix.  The last word must end with last_suffix (and be longer than
+    it).  The words are passed to template.format in order.
+
+    Candidates are found by searching for the last fixed text (the suffix, or
+    the last glue) and reading the words before it backwards.  That finds
+    matches leftmost first as long as no match can contain another's last
+    fixed text, which holds for the shapes the engines use; `python -m
+    benchmarks transformations` checks them against re.sub.
+    """
+
+    def __init__(self, glues, template, prefix='', suffix='', last_suffix=''):
+        self.glues = tuple(glues)
+        self.template = template
+        self.prefix = prefix
+        self.suffix = suffix
+        self.last_suffix = last_suffix
+        self.required = max((prefix, last_suffix + suffix) + self.glues, key=len)
+        self.anchor = suffix or self.glues[-1]
+        # Words must be whole runs of word characters, so the fixed text
+        # around them has to start and end with non-word characters
+        if (prefix and WORD.match(prefix[-1])) or (suffix and WORD.match(suffix)) or \
+                any(WORD.match(glue) or WORD.match(glue[-1]) for glue in self.glues):
+            raise ValueError("fixed text must not run into the words around it")
+
+    def matches(self, segment):
+        text = segment.text
+        last_end = 0
+        anchor = text.find(self.anchor)
+        while anchor >= 0:
+            match = self._match_at(segment, anchor, last_end)
+            if match is None:
+                anchor = text.find(self.anchor, anchor + 1)
+            else:
+                yield match
+                last_end = match[1]
+                anchor = text.find(self.anchor, last_end)
+
+    def _match_at(self, segment, anchor, last_end):
+        """Return (start, end, replacement) for the match ending with the fixed text at anchor, or None."""
+        text = segment.text
+        if self.suffix:
+            glues = self.glues
+            end = anchor + len(self.suffix)
+            words = []
+        else:
+            glues = self.glues[:-1]
+            word_start = anchor + len(self.anchor)
+            end = segment.word_end(word_start)
+            if end == word_start:
+                return None
+            words = [text[word_start:end]]
+
+        # Read the words before the anchor, last first
+        position = anchor
+        for glue in reversed(glues):
+            word_start = segment.word_start(position)
+            if word_start == position:
+                return None
+            words.append(text[word_start:position])
+            position = word_start - len(glue)
+            if position < last_end or not text.startswith(glue, position):
+                return None
+
+        start = segment.word_start(position)
+        if self.prefix:
+            match_start = start - len(self.prefix)
+            if match_start < last_end or not text.startswith(self.prefix, match_start):
+                return None
+        else:
+            # A word cut short by the previous match still counts from where it ended
+            start = match_start = max(start, last_end)
+        if start >= position:
+            return None
+        words.append(text[start:position])
+        words.reverse()
+
+        if self.last_suffix and (len(words[-1]) <= len(self.last_suffix)
+                                 or not words[-1].endswith(self.last_suffix)):
+            return None
+        return match_start, end, self.template.format(*words)
+
+
+class ClauseSequence(Transformation):
+    """Clauses separated by fixed text on one line, e.g. (.*?) is to (.*?) by (.*?).
+
+    Each clause runs from where the last one ended up to the next occurrence
+    of its separator, without crossing a line break.  The clauses are passed
+    to template.format in order.
+    """
+
+    def __init__(self, separators, template):
+        self.separators = tuple(separators)
+        self.template = template
+        self.required = max(self.separators, key=len)
+
+    def matches(self, segment):
+        text = segment.text
+        size = len(text)
+        position = 0
+        line_end = -1
+        while position <= size:
+            if line_end < position:
+                line_end = text.find('\n', position)
+                if line_end < 0:
+                    line_end = size
+
+            clauses = []
+            end = position
+            for separator in self.separators:
+                found = text.find(separator, end, line_end)
+                if found < 0:
+                    break
+                clauses.append(text[end:found])
+                end = found + len(separator)
+            else:
+                yield position, end, self.template.format(*clauses)
+                position = end
+                continue
+
+            # Nothing more on this line
+            position = line_end + 1